@@ -12,7 +12,9 @@ import dfdetector
 
 app = Flask(__name__)
 UPLOAD_FOLDER = "./deepfake_detector/static/videos/"
-DEVICE = "cpu"
+# device for detection and inference, the GPU if available unless DEVICE is set, e.g. DEVICE=cpu
+DEVICE = os.environ.get("DEVICE")
+dfdetector.df_retinaface.configure(device=DEVICE)
 
 
 
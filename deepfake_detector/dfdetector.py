@@ -33,6 +33,10 @@ from sklearn.model_selection import ShuffleSplit
 from sklearn.metrics import confusion_matrix
 from tqdm import tqdm
 from facedetector.retinaface import df_retinaface
+from facedetector.detection_store import DetectionStore
+from facedetector.frame_cache import FrameCache
+from facedetector.video_index import VideoIndex
+from facedetector.buffer_pool import BufferPool
 from pretrained_mods import efficientnetb1lstm
 from pretrained_mods import mesonet
 from pretrained_mods import resnetlstm
@@ -81,7 +85,67 @@ parser.add_argument('--face_margin', default=0.3,
 parser.add_argument('--seed', default=24,
                     type=int, help='Choose the random seed.')
 parser.add_argument('--save_path', default=None,
-                    type=str, help='Choose the path where face crops shall be saved.')                       
+                    type=str, help='Choose the path where face crops shall be saved.')
+parser.add_argument('--sampling', default="grab",
+                    type=str, help='Choose how frames are read from videos: grab or seek.')
+parser.add_argument('--frame_cache', default=None,
+                    type=str, help='Choose a folder to cache the sampled video frames in.')
+parser.add_argument('--frame_cache_size', default=20.0,
+                    type=float, help='Choose the maximum size of the frame cache in GB.')
+parser.add_argument('--stage_workers', default=None,
+                    type=str, help='Choose worker threads per pipeline stage, e.g. decode=2,detect=1,crop=1,classify=1.')
+parser.add_argument('--workers', default=1,
+                    type=int, help='Choose the number of processes that benchmark videos are split across.')
+parser.add_argument('--det_scale', default="1.0",
+                    type=str, help='Choose the factor that frames are resized by before face detection or auto.')
+parser.add_argument('--video_index', default=False,
+                    type=bool, help='Choose whether to index the videos and process the most expensive videos first.')
+parser.add_argument('--early_exit', default=None,
+                    type=float, help='Choose the mean frame prediction (e.g. 0.9) at which classifying a video stops early.')
+parser.add_argument('--min_frames', default=3,
+                    type=int, help='Choose the number of frames that are classified at least with early exit.')
+parser.add_argument('--buffer_pool', default=False,
+                    type=bool, help='Choose whether to reuse preallocated memory for frames, detector input and face crops.')
+parser.add_argument('--dedup', default=None,
+                    type=float, help='Choose the mean gray value difference (e.g. 3.0) up to which frames count as duplicates and reuse the face detection.')
+parser.add_argument('--reuse_predictions', default=False,
+                    type=bool, help='Choose whether duplicate face crops reuse the prediction as well.')
+parser.add_argument('--fused_inputs', default=False,
+                    type=bool, help='Choose whether to crop, resize and normalize the faces of a video in one pass to the classifier input.')
+parser.add_argument('--retain_crops', default=None,
+                    type=float, help='Choose the largest face margin (e.g. 0.3) of face crops that are kept instead of the full frames after face detection.')
+parser.add_argument('--detect_batch_size', default=1,
+                    type=int, help='Choose the number of frames of a video that faces are detected in with one forward pass.')
+parser.add_argument('--detect_videos', default=1,
+                    type=int, help='Choose the number of videos whose frames are detected together in batches of the same detector input size.')
+parser.add_argument('--detect_bucket', default=None,
+                    type=int, help='Choose a multiple of pixels (e.g. 32) that detector inputs are padded to, so that frames of similar resolution share batches.')
+parser.add_argument('--detector', default="resnet50",
+                    type=str, help='Choose the face detector: resnet50 or the faster mobile0.25.')
+parser.add_argument('--device', default=None,
+                    type=str, help='Choose the device for face detection, inference and training, e.g. cpu or cuda. Uses the GPU if available by default.')
+parser.add_argument('--track', default=None,
+                    type=int, help='Choose the keyframe interval (e.g. 5) at which faces are detected, the face box is tracked in the frames between.')
+parser.add_argument('--track_min_score', default=0.8,
+                    type=float, help='Choose the template matching score below which a tracked face is detected again.')
+parser.add_argument('--roi', default=None,
+                    type=float, help='Choose the margin (e.g. 1.0) of the region around the previous face box in which faces are detected instead of the whole frame.')
+parser.add_argument('--detection_store', default=None,
+                    type=str, help='Choose a directory that keeps the face detections of videos for later runs.')
+parser.add_argument('--torchscript', default=False,
+                    type=bool, help='Choose whether to load the face detector from a TorchScript export that is created next to its weights on first use.')
+parser.add_argument('--int8', default=False,
+                    type=bool, help='Choose whether to use the INT8 face detector on the CPU, it is created with profiling.py --task quantize.')
+parser.add_argument('--deploy', default=False,
+                    type=bool, help='Choose whether to use the face detector without its landmark head, only the face box is used.')
+parser.add_argument('--det_levels', default=None,
+                    type=str, help='Choose the FPN levels that the face detector keeps with --deploy, e.g. 1,2 drops the stride 8 level for small faces.')
+parser.add_argument('--precision', default=None,
+                    type=str, help='Choose reduced precision for face detection and inference: bf16 (CPU or GPU) or fp16 (GPU).')
+parser.add_argument('--num_threads', default=None,
+                    type=int, help='Choose the number of CPU threads of pytorch operations, shared by all worker processes.')
+parser.add_argument('--interop_threads', default=None,
+                    type=int, help='Choose the number of CPU threads that run independent pytorch operations in parallel.')                       
                                                              
                                       
 
@@ -98,8 +162,14 @@ class DFDetector():
         pass
 
     @classmethod
-    def detect_single(cls, video_path=None, image_path=None, label=None, method="xception_uadfv", cmd=False):
+    def detect_single(cls, video_path=None, image_path=None, label=None, method="xception_uadfv", cmd=False, detector=None):
         """Perform deepfake detection on a single video with a chosen method."""
+        # face detector tier: resnet50 or mobile0.25, only for this call
+        with df_retinaface.configured(detector=detector or df_retinaface.options['detector']):
+            return cls._detect_single(video_path, image_path, label, method, cmd)
+
+    @classmethod
+    def _detect_single(cls, video_path=None, image_path=None, label=None, method="xception_uadfv", cmd=False):
         # prepare the method of choice
         sequence_model = False
         if method == "xception_uadfv":
@@ -357,7 +427,7 @@ class DFDetector():
                 return used, result
 
     @classmethod
-    def benchmark(cls, dataset=None, data_path=None, method="xception_celebdf", seed=24):
+    def benchmark(cls, dataset=None, data_path=None, method="xception_celebdf", seed=24, stage_workers=None, workers=1, video_index=False, early_exit=None, min_frames=3, detector=None):
         """Benchmark deepfake detection methods against popular deepfake datasets.
            The methods are already pretrained on the datasets. 
            Methods get benchmarked against a test set that is distinct from the training data.
@@ -365,8 +435,23 @@ class DFDetector():
             dataset: The dataset that the method is tested against.
             data_path: The path to the test videos.
             method: The deepfake detection method that is used.
+            stage_workers: Worker threads per pipeline stage (decode, detect, crop, classify).
+                           Videos are processed one after another if None.
+            workers: Number of processes that the test videos are split across.
+            video_index: Whether to index frame count, fps and resolution of the videos
+                         and schedule the most expensive videos first.
+            early_exit: Classify frames in coarse-to-fine order and stop once the mean prediction
+                        reaches early_exit or 1 - early_exit. Only for frame-level methods.
+            min_frames: Number of frames that are classified at least with early exit.
+            detector: Face detector tier, resnet50 or mobile0.25. Defaults to the configured tier.
         # Implementation: Christopher Otto
         """
+        # the face detector tier only applies to this benchmark
+        with df_retinaface.configured(detector=detector or df_retinaface.options['detector']):
+            return cls._benchmark(dataset, data_path, method, seed, stage_workers, workers, video_index, early_exit, min_frames)
+
+    @classmethod
+    def _benchmark(cls, dataset=None, data_path=None, method="xception_celebdf", seed=24, stage_workers=None, workers=1, video_index=False, early_exit=None, min_frames=3):
         # seed numpy and pytorch for reproducibility
         reproducibility_seed(seed)
         if method not in ['xception_uadfv', 'xception_celebdf', 'xception_dftimit_hq', 'xception_dftimit_lq', 'xception_dfdc', 'efficientnetb7_uadfv', 'efficientnetb7_celebdf', 'efficientnetb7_dftimit_hq', 'efficientnetb7_dftimit_lq', 'efficientnetb7_dfdc', 'mesonet_uadfv', 'mesonet_celebdf', 'mesonet_dftimit_hq', 'mesonet_dftimit_lq', 'mesonet_dfdc', 'resnet_lstm_uadfv', 'resnet_lstm_celebdf', 'resnet_lstm_dftimit_hq', 'resnet_lstm_dftimit_lq', 'resnet_lstm_dfdc', 'efficientnetb1_lstm_uadfv', 'efficientnetb1_lstm_celebdf', 'efficientnetb1_lstm_dftimit_hq', 'efficientnetb1_lstm_dftimit_lq', 'efficientnetb1_lstm_dfdc', 'dfdcrank90_uadfv', 'dfdcrank90_celebdf', 'dfdcrank90_dftimit_hq', 'dfdcrank90_dftimit_lq', 'dfdcrank90_dfdc', 'six_method_ensemble_uadfv', 'six_method_ensemble_celebdf', 'six_method_ensemble_dftimit_hq', 'six_method_ensemble_dftimit_lq', 'six_method_ensemble_dfdc']:
@@ -401,6 +486,8 @@ class DFDetector():
         # get test labels for metric evaluation
         df = label_data(dataset_path=cls.data_path,
                         dataset=cls.dataset, test_data=True)
+        if video_index:
+            index_videos(cls.dataset, df['video'])
         # prepare the method of choice
         if cls.method == "xception_uadfv" or cls.method == 'xception_celebdf' or cls.method == 'xception_dftimit_hq' or cls.method == 'xception_dftimit_lq' or cls.method == 'xception_dfdc':
             model, img_size, normalization = prepare_method(
@@ -420,7 +507,7 @@ class DFDetector():
         elif cls.method == 'dfdcrank90_uadfv' or cls.method == 'dfdcrank90_celebdf' or cls.method == 'dfdcrank90_dftimit_hq' or cls.method == 'dfdcrank90_dftimit_lq' or cls.method == 'dfdcrank90_dfdc':
             # evaluate dfdcrank90 ensemble
             auc, ap, loss, acc = prepare_dfdc_rank90(
-                method, cls.dataset, df, face_margin, num_frames)
+                method, cls.dataset, df, face_margin, num_frames, stage_workers=stage_workers, workers=workers, seed=seed)
             return [auc, ap, loss, acc]
         elif cls.method == 'six_method_ensemble_uadfv' or cls.method == 'six_method_ensemble_celebdf' or cls.method == 'six_method_ensemble_dftimit_hq' or cls.method == 'six_method_ensemble_dftimit_lq'or cls.method == 'six_method_ensemble_dfdc':
             # evaluate six method ensemble
@@ -433,16 +520,16 @@ class DFDetector():
         if cls.method == 'resnet_lstm_uadfv' or cls.method == 'efficientnetb1_lstm_uadfv' or cls.method == 'resnet_lstm_celebdf' or cls.method == 'resnet_lstm_dfdc' or cls.method == 'efficientnetb1_lstm_celebdf' or cls.method == 'resnet_lstm_dftimit_hq' or cls.method == 'resnet_lstm_dftimit_lq' or cls.method == 'efficientnetb1_lstm_dftimit_hq' or cls.method == 'efficientnetb1_lstm_dftimit_lq' or cls.method == 'efficientnetb1_lstm_dfdc':
             # inference for sequence models
             auc, ap, loss, acc = test.inference(
-                model, df, img_size, normalization, dataset=cls.dataset, method=cls.method, face_margin=face_margin, sequence_model=True, num_frames=num_frames)
+                model, df, img_size, normalization, dataset=cls.dataset, method=cls.method, face_margin=face_margin, sequence_model=True, num_frames=num_frames, stage_workers=stage_workers, workers=workers, seed=seed, early_exit=early_exit, min_frames=min_frames)
         else:
             auc, ap, loss, acc = test.inference(
-                model, df, img_size, normalization, dataset=cls.dataset, method=cls.method, face_margin=face_margin, num_frames=num_frames)
+                model, df, img_size, normalization, dataset=cls.dataset, method=cls.method, face_margin=face_margin, num_frames=num_frames, stage_workers=stage_workers, workers=workers, seed=seed, early_exit=early_exit, min_frames=min_frames)
 
         return [auc, ap, loss, acc]
 
     @classmethod
     def train_method(cls, dataset=None, data_path=None, method="xception", img_save_path=None, epochs=1, batch_size=32,
-                     lr=0.001, folds=1, augmentation_strength='weak', fulltrain=False, faces_available=False, face_margin=0, seed=24):
+                     lr=0.001, folds=1, augmentation_strength='weak', fulltrain=False, faces_available=False, face_margin=0, seed=24, video_index=False):
         """Train a deepfake detection method on a dataset."""
         if img_save_path is None:
             raise ValueError(
@@ -608,6 +695,10 @@ class DFDetector():
                     f"Apply {cls.face_margin*100}% margin to each side of the face crop.")
             else:
                 print("Apply no margin to the face crop.")
+            if video_index:
+                # extract faces from the most expensive videos first
+                index_videos(cls.dataset, df['video'])
+                df = df.iloc[test.schedule(df)]
             # load retinaface face detector
             net, cfg = df_retinaface.load_face_detector()
             for idx, row in tqdm(df.iterrows(), total=df.shape[0]):
@@ -677,6 +768,9 @@ class DFDetector():
                 # save frames to directory
                 vid_frames = df_retinaface.extract_frames(
                     faces, video, save_to=save_dir, face_margin=cls.face_margin, num_frames=num_frames, test=False)
+            if df_retinaface.options['detection_store'] is not None:
+                # keep the face detections for benchmarks and later trainings
+                df_retinaface.options['detection_store'].flush()
 
         # put all face images in dataframe
         df_faces = label_data(dataset_path=cls.data_path,
@@ -702,7 +796,7 @@ def prepare_method(method, dataset, mode='train'):
             # load the xception model that was pretrained on the respective datasets training data
             if method == 'xception_uadfv' or method == 'xception_celebdf' or method == 'xception_dftimit_hq' or method == 'xception_dftimit_lq' or method == 'xception_dfdc':
                 model_params = torch.load(
-                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
+                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth', map_location='cpu')
                 print(os.getcwd(
                 ) + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
                 model.load_state_dict(model_params)
@@ -723,7 +817,7 @@ def prepare_method(method, dataset, mode='train'):
                 model.classifier = nn.Linear(2560, 1)
                 # load the efficientnet model that was pretrained on the uadfv training data
                 model_params = torch.load(
-                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
+                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth', map_location='cpu')
                 model.load_state_dict(model_params)
             return model, img_size, normalization
         elif mode == 'train':
@@ -741,7 +835,7 @@ def prepare_method(method, dataset, mode='train'):
                 model = mesonet.MesoInception4()
                 # load the mesonet model that was pretrained on the uadfv training data
                 model_params = torch.load(
-                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
+                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth', map_location='cpu')
                 print(os.getcwd(
                 ) + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
                 model.load_state_dict(model_params)
@@ -759,7 +853,7 @@ def prepare_method(method, dataset, mode='train'):
                 model = resnetlstm.ResNetLSTM()
                 # load the mesonet model that was pretrained on the uadfv training data
                 model_params = torch.load(
-                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
+                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth', map_location='cpu')
                 print(os.getcwd(
                 ) + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
                 model.load_state_dict(model_params)
@@ -777,7 +871,7 @@ def prepare_method(method, dataset, mode='train'):
                 model = efficientnetb1lstm.EfficientNetB1LSTM()
                 # load the mesonet model that was pretrained on the uadfv training data
                 model_params = torch.load(
-                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
+                    os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{method}.pth', map_location='cpu')
                 print(os.getcwd(
                 ) + f'/deepfake_detector/pretrained_mods/weights/{method}.pth')
                 model.load_state_dict(model_params)
@@ -792,7 +886,7 @@ def prepare_method(method, dataset, mode='train'):
             f"{method} is not available. Please use one of the available methods.")
 
 
-def prepare_dfdc_rank90(method, dataset, df, face_margin, num_frames, single=False, cmd=False):
+def prepare_dfdc_rank90(method, dataset, df, face_margin, num_frames, single=False, cmd=False, stage_workers=None, workers=1, seed=24):
     """Prepares the DFDC rank 90 ensemble."""
     img_size_xception = 299
     img_size_b1 = 240
@@ -822,31 +916,31 @@ def prepare_dfdc_rank90(method, dataset, df, face_margin, num_frames, single=Fal
     model3 = efficientnetb1lstm.EfficientNetB1LSTM()
     # load the xception model that was pretrained on the uadfv training data
     model_params3 = torch.load(
-        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod1}.pth')
+        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod1}.pth', map_location='cpu')
     model3.load_state_dict(model_params3)
     print("Inference EfficientNetB1 + LSTM")
     df3 = test.inference(
-        model3, df, img_size_b1, normalization_b1, dataset=dataset, method=method, face_margin=face_margin, sequence_model=True, ensemble=True, num_frames=num_frames, single=single, cmd=cmd)
+        model3, df, img_size_b1, normalization_b1, dataset=dataset, method=method, face_margin=face_margin, sequence_model=True, ensemble=True, num_frames=num_frames, single=single, cmd=cmd, stage_workers=stage_workers, workers=workers, seed=seed)
 
     model1 = xception.imagenet_pretrained_xception()
     # load the xception model that was pretrained on the uadfv training data
     model_params1 = torch.load(
-        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod2}.pth')
+        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod2}.pth', map_location='cpu')
     model1.load_state_dict(model_params1)
 
     print("Inference Xception One")
     df1 = test.inference(
-        model1, df, img_size_xception, normalization_xception, dataset=dataset, method=method, face_margin=face_margin, ensemble=True, num_frames=num_frames, single=single, cmd=cmd)
+        model1, df, img_size_xception, normalization_xception, dataset=dataset, method=method, face_margin=face_margin, ensemble=True, num_frames=num_frames, single=single, cmd=cmd, stage_workers=stage_workers, workers=workers, seed=seed)
 
     model2 = xception.imagenet_pretrained_xception()
     # load the xception model that was pretrained on the uadfv training data
     model_params2 = torch.load(
-        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod3}.pth')
+        os.getcwd() + f'/deepfake_detector/pretrained_mods/weights/{mod3}.pth', map_location='cpu')
     model2.load_state_dict(model_params2)
 
     print("Inference Xception Two")
     df2 = test.inference(
-        model2, df, img_size_xception, normalization_xception, dataset=dataset, method=method, face_margin=face_margin, ensemble=True, num_frames=num_frames, single=single, cmd=cmd)
+        model2, df, img_size_xception, normalization_xception, dataset=dataset, method=method, face_margin=face_margin, ensemble=True, num_frames=num_frames, single=single, cmd=cmd, stage_workers=stage_workers, workers=workers, seed=seed)
     # average predictions of all three models
 
     if single:
@@ -1770,9 +1864,62 @@ def six_method_app(method, video_path, sequence_model, cmd=False):
     return loss
 
 
+def parse_det_scale(text):
+    """Detection scale from a command line argument: 'auto' or a number."""
+    if text == 'auto':
+        return text
+    return float(text)
+
+
+def parse_det_levels(text):
+    """Turn "1,2" into (1, 2)."""
+    if text is None:
+        return None
+    return tuple(int(level) for level in text.split(','))
+
+
+def parse_stage_workers(text):
+    """Turn "decode=2,detect=1" into {'decode': 2, 'detect': 1}."""
+    if text is None:
+        return None
+    stage_workers = {}
+    for entry in text.split(','):
+        name, count = entry.split('=')
+        stage_workers[name.strip()] = int(count)
+    return stage_workers
+
+
+def index_videos(dataset, videos):
+    """Build the video index of a dataset and use it for face detection."""
+    index = VideoIndex(f'{dataset}_video_index.csv').build(list(videos))
+    df_retinaface.configure(video_index=index)
+    return index
+
+
 def main():
     # parse arguments
     args = parser.parse_args()
+    # cpu threads have to be set before pytorch runs any operation
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    if args.interop_threads is not None:
+        torch.set_num_interop_threads(args.interop_threads)
+    # set up the face detection pipeline
+    frame_cache = None
+    if args.frame_cache is not None:
+        frame_cache = FrameCache(
+            args.frame_cache, max_bytes=int(args.frame_cache_size * 1024**3))
+    df_retinaface.configure(sampling=args.sampling, frame_cache=frame_cache,
+                            det_scale=parse_det_scale(args.det_scale),
+                            buffer_pool=BufferPool() if args.buffer_pool else None,
+                            dedup=args.dedup, reuse_predictions=args.reuse_predictions,
+                            fused_inputs=args.fused_inputs, retain_crops=args.retain_crops,
+                            detect_batch_size=args.detect_batch_size, detect_videos=args.detect_videos,
+                            detect_bucket=args.detect_bucket, device=args.device,
+                            detector=args.detector, track=args.track, track_min_score=args.track_min_score, roi=args.roi,
+                            detection_store=None if args.detection_store is None else DetectionStore(args.detection_store),
+                            precision=args.precision, torchscript=args.torchscript, int8=args.int8,
+                            deploy=args.deploy, det_levels=parse_det_levels(args.det_levels))
     # initialize the deepfake detector with the desired task
     if args.detect_single:
         print(f"Detecting with {args.detection_method}.")
@@ -1780,12 +1927,12 @@ def main():
             video_path=args.path_to_vid, image_path=args.path_to_img, method=args.detection_method, cmd=args.cmd)
     elif args.benchmark:
         DFDetector.benchmark(
-            dataset=args.dataset, data_path=args.data_path, method=args.detection_method)
+            dataset=args.dataset, data_path=args.data_path, method=args.detection_method, seed=args.seed, stage_workers=parse_stage_workers(args.stage_workers), workers=args.workers, video_index=args.video_index, early_exit=args.early_exit, min_frames=args.min_frames)
     elif args.train:
         print(args)
         print(args.facecrops_available)
         DFDetector.train_method(dataset=args.dataset, data_path=args.data_path, method=args.model_type, img_save_path=args.save_path, epochs=args.epochs, batch_size=args.batch_size,
-                     lr=args.lr, folds=args.folds, augmentation_strength=args.augs, fulltrain=args.fulltrain,  face_margin=args.face_margin, faces_available=args.facecrops_available, seed=args.seed)
+                     lr=args.lr, folds=args.folds, augmentation_strength=args.augs, fulltrain=args.fulltrain,  face_margin=args.face_margin, faces_available=args.facecrops_available, seed=args.seed, video_index=args.video_index)
     else:
         print("Please choose one of the three modes: detect_single, benchmark, or train.")
 
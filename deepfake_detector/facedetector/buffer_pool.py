@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class BufferPool():
+    """
+    Reusable memory for the frames of a video, the face detector input and the face crops.
+    Every buffer is a flat array that grows to the largest size requested so far.
+    Requests return a contiguous view of the requested shape, so the same memory
+    is used for every video instead of allocating new arrays per frame.
+    A buffer is overwritten by the next request with the same name,
+    so the pool must not be shared by videos that are processed at the same time.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        # number of buffer requests and of requests that needed new memory
+        self.requests = 0
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Array of the given shape and dtype that is backed by the buffer with this name."""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        self.requests += 1
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer[:size].reshape(shape)
+
+    def nbytes(self):
+        """Memory held by the pool in bytes."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def __getstate__(self):
+        # worker processes start with an empty pool instead of a copy of the buffers
+        return {'_buffers': {}, 'requests': 0, 'allocations': 0}
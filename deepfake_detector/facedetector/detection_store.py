@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from facedetector.frame_cache import FrameCache, atomic_write
+
+
+class DetectionStore():
+    """
+    Face detections of the sampled frames of videos that are kept across runs.
+    The detections of one face detector configuration are stored in one .npz file
+    with a row per video and sampled frame: the video, the frame index, whether a face
+    was found, how it was found and the box, score and five landmarks.
+    Videos are identified by path, size and modification time, so changed videos are detected again.
+    """
+    # how the face of a frame was found, see df_retinaface.detect_frames
+    SOURCES = ('detected', 'duplicate', 'tracked')
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+        # detections per configuration, keyed by video identity and sampled frame indices
+        self._tables = {}
+        # entries that are not written to disk yet
+        self._new = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def config_key(config):
+        return json.dumps(config, sort_keys=True)
+
+    def _path(self, key):
+        return os.path.join(self.store_dir, 'detections_' + hashlib.sha1(key.encode()).hexdigest()[:16] + '.npz')
+
+    def _table(self, key):
+        """Detections of a configuration, loaded from disk on first use."""
+        table = self._tables.get(key)
+        if table is None:
+            table = self._load(key)
+            self._tables[key] = table
+        return table
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return {}
+        with np.load(path) as npz:
+            data = dict(npz)
+        table = {}
+        rows = np.split(np.arange(len(data['video'])),
+                        np.flatnonzero(np.diff(data['video'])) + 1)
+        for video_rows in rows:
+            if video_rows.size == 0:
+                continue
+            identity = str(data['videos'][data['video'][video_rows[0]]])
+            indices = tuple(int(idx) for idx in data['frame'][video_rows])
+            table[(identity, indices)] = [
+                (data['dets'][row:row + 1] if data['found'][row] else np.empty((0, 15), dtype=np.float32),
+                 self.SOURCES[data['source'][row]]) for row in video_rows]
+        return table
+
+    @staticmethod
+    def _key(video, indices, frame_count):
+        # videos that decode fewer frames than sampled keep the indices of the decoded frames
+        return (FrameCache.video_identity(video), tuple(int(idx) for idx in indices[:frame_count]))
+
+    def get(self, config, video, indices, frame_count):
+        """
+        (dets, source) of each sampled frame of the video or None if they are not stored.
+        frame_count is the number of frames that were decoded of the sampled indices.
+        """
+        key = self._key(video, indices, frame_count)
+        with self._lock:
+            entry = self._table(self.config_key(config)).get(key)
+        if entry is None:
+            return None
+        return [(dets.copy(), source) for dets, source in entry]
+
+    def put(self, config, video, indices, faces):
+        """Store the detections of the sampled frames of a video, faces as returned by df_retinaface.detect_frames."""
+        key = self._key(video, indices, len(faces))
+        entry = [(face[1][:1].copy(), face[2] if len(face) > 2 else 'detected') for face in faces]
+        self.add({self.config_key(config): {key: entry}})
+
+    def take_new(self):
+        """Remove and return the entries that were added since the last call, e.g. to send them from a worker process."""
+        with self._lock:
+            new, self._new = self._new, {}
+        return new
+
+    def add(self, new):
+        """Add entries of take_new, they are written to disk with the next flush."""
+        with self._lock:
+            for config_key, entries in new.items():
+                self._table(config_key).update(entries)
+                self._new.setdefault(config_key, {}).update(entries)
+
+    def flush(self):
+        """Write the configurations with new entries to disk."""
+        with self._lock:
+            for key in self._new:
+                self._save(key, self._table(key))
+            self._new = {}
+
+    def _save(self, key, table):
+        videos, video, frame, found, source, dets = [], [], [], [], [], []
+        for (identity, indices), entry in table.items():
+            videos.append(identity)
+            for idx, (face, face_source) in zip(indices, entry):
+                video.append(len(videos) - 1)
+                frame.append(idx)
+                found.append(len(face) > 0)
+                source.append(self.SOURCES.index(face_source))
+                dets.append(face[0] if len(face) > 0 else np.zeros(15, dtype=np.float32))
+        atomic_write(self._path(key), lambda f: np.savez_compressed(
+            f, config=np.array(key), videos=np.array(videos, dtype=str),
+            video=np.array(video, dtype=np.int32), frame=np.array(frame, dtype=np.int32),
+            found=np.array(found, dtype=bool), source=np.array(source, dtype=np.int8),
+            dets=np.array(dets, dtype=np.float32).reshape(-1, 15)))
+
+    def __getstate__(self):
+        # worker processes load the stored detections from disk and send new entries back with take_new
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['store_dir'])
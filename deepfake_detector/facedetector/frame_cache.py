@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+def atomic_write(path, write):
+    """Write a file with write(f) so that parallel readers never see partial files."""
+    # write to a temporary file first and move it to the path
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class FrameCache():
+    """
+    On-disk cache of the frames that are sampled from a video.
+    The frames of a video are stored as one .npy file that is memory-mapped on reading.
+    Entries are keyed by the video's path, size, modification time and the sampled indices.
+    The least recently used entries are removed when the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=20 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def video_identity(video):
+        """Path, size and modification time of a video."""
+        stat = os.stat(video)
+        return f"{os.path.abspath(video)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def _path(self, name, ext):
+        return os.path.join(self.cache_dir, hashlib.sha1(name.encode()).hexdigest() + ext)
+
+    def _entry_path(self, video, indices):
+        name = self.video_identity(video) + '|' + \
+            ','.join(str(int(i)) for i in indices)
+        return self._path(name, '.npy')
+
+    def frame_count(self, video):
+        """Frame count of the video if it was stored before, else None."""
+        path = self._path(self.video_identity(video), '.count')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return int(f.read())
+
+    def put_frame_count(self, video, frame_len):
+        """Store the frame count, so that hits need no video decoder."""
+        path = self._path(self.video_identity(video), '.count')
+        atomic_write(path, lambda f: f.write(str(frame_len).encode()))
+
+    def get(self, video, indices):
+        """Sampled frames of the video or None if they are not cached."""
+        path = self._entry_path(video, indices)
+        try:
+            # copy-on-write mapping: frames are writeable, the file stays untouched
+            frames = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            return None
+        # mark entry as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process after mapping, the mapped frames stay readable
+            pass
+        return list(frames)
+
+    def put(self, video, indices, frames):
+        """Store the sampled frames of a video and evict old entries."""
+        if len(frames) > 0 and len(set(frame.shape for frame in frames)) > 1:
+            # frames of different size can not be stacked
+            return
+        frames = np.stack(frames) if len(
+            frames) > 0 else np.empty((0,), dtype=np.uint8)
+        path = self._entry_path(video, indices)
+        atomic_write(path, lambda f: np.save(f, frames))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -40,3 +40,19 @@ cfg_re50 = {
     'out_channel': 256
 }
 
+
+def deploy_cfg(cfg, levels=None):
+    """
+    Config of a RetinaFace for deployment that only returns boxes and scores.
+    levels: FPN levels to keep, 0 (stride 8) to 2 (stride 32), None keeps all.
+            The anchor sizes and steps are reduced to them, so that PriorBox matches the network.
+    """
+    levels = sorted(set(range(len(cfg['steps'])) if levels is None else levels))
+    if not levels or not set(levels) <= set(range(len(cfg['steps']))):
+        raise ValueError(f"FPN levels must be a non-empty subset of 0 to {len(cfg['steps']) - 1}.")
+    cfg = dict(cfg)
+    cfg['levels'] = levels
+    cfg['landmarks'] = False
+    cfg['min_sizes'] = [cfg['min_sizes'][level] for level in levels]
+    cfg['steps'] = [cfg['steps'][level] for level in levels]
+    return cfg
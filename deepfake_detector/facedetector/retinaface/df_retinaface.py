@@ -1,22 +1,179 @@
 import argparse
+import contextlib
 import os
-import time
 
 import numpy as np
 import torch
 import torch.backends.cudnn as cudnn
 
 import cv2
-from facedetector.retinaface.data import cfg_mnet, cfg_re50
-from facedetector.retinaface.layers.functions.prior_box import PriorBox
+from facedetector.frame_cache import atomic_write
+from facedetector.retinaface.data import cfg_mnet, cfg_re50, deploy_cfg
+from facedetector.retinaface.layers.functions.prior_box import cached_priors
 from facedetector.retinaface.models.retinaface import RetinaFace
-from facedetector.retinaface.utils.box_utils import decode, decode_landm
-from facedetector.retinaface.utils.nms.py_cpu_nms import py_cpu_nms
+from facedetector.retinaface.utils.box_utils import batched_nms, decode, decode_landm
 from tqdm import tqdm
 
 # from https://github.com/biubug6/Pytorch_Retinaface
 # MIT License
 
+# gaps between sampled frames up to this length are decoded instead of seeked
+SEEK_MIN_GAP = 25
+# longer frame side in pixels that frames are downscaled to with det_scale='auto'
+AUTO_DET_MAX_SIDE = 960
+# folder with the face detector weights
+DETECTOR_DIR = os.getcwd() + "/deepfake_detector/facedetector/retinaface/"
+# weights of the face detector tiers, mobile0.25 is faster and less accurate
+DETECTOR_WEIGHTS = {'resnet50': 'Resnet50_Final.pth',
+                    'mobile0.25': 'mobilenet0.25_Final.pth'}
+# input sizes at which the TorchScript export is compared to the eager face detector
+EXPORT_CHECK_SIZES = ((1, 3, 240, 320), (2, 3, 480, 640), (1, 3, 720, 1280))
+# largest absolute output difference that the TorchScript export may have
+EXPORT_TOLERANCE = 1e-4
+# BGR mean that is subtracted from frames before face detection
+DET_MEAN = np.array((104, 117, 123), dtype=np.float32).reshape(3, 1, 1)
+# faces with a score above this threshold are detected, the top_k best before and after NMS are kept
+DET_CONFIDENCE = 0.9
+DET_TOP_K = 1
+DET_NMS_THRESHOLD = 0.4
+# side length of the grayscale thumbnails that are compared to find duplicate frames
+THUMBNAIL_SIZE = 32
+# the tracker searches the face in the box enlarged by this fraction of its size on each side
+TRACK_MARGIN = 0.5
+# longer side of the face template in pixels that frames are downscaled to for tracking
+TRACK_TEMPLATE_SIZE = 32
+# side length in pixels of the face detector input for regions around the previous face
+ROI_SIZE = 320
+# retained face crops are larger than the face margin by this fraction of the box size on each side
+RETAIN_HEADROOM = 0.1
+
+# runtime options of the face detection pipeline, changed with configure()
+options = {
+    # 'grab' decodes all frames up to the last sampled frame, 'seek' jumps to them
+    'sampling': 'grab',
+    # facedetector.frame_cache.FrameCache that stores sampled frames on disk
+    'frame_cache': None,
+    # facedetector.video_index.VideoIndex with the frame counts of the videos
+    'video_index': None,
+    # facedetector.buffer_pool.BufferPool that decoded frames, detector input and face crops are written into
+    'buffer_pool': None,
+    # frames whose mean absolute thumbnail difference to the last detected frame is at most
+    # this value reuse its face detection, None detects faces in every frame
+    'dedup': None,
+    # duplicate face crops also reuse the classifier prediction
+    'reuse_predictions': False,
+    # crop, resize and normalize the faces of a video in one pass to the classifier input
+    'fused_inputs': False,
+    # number of frames that the face detector processes in one forward pass
+    'detect_batch_size': 1,
+    # number of videos whose frames are detected together by test.inference
+    'detect_videos': 1,
+    # pad detector inputs to a multiple of this many pixels, so that frames of
+    # similar resolution share batches, None only batches frames of the same size
+    'detect_bucket': None,
+    # device of the face detector and classifier, None uses the GPU if available
+    'device': None,
+    # face detector tier, resnet50 or mobile0.25
+    'detector': 'resnet50',
+    # detect faces in every track-th frame and track the face box in the frames between, None detects in every frame
+    'track': None,
+    # template matching score below which a tracked frame is detected again
+    'track_min_score': 0.8,
+    # resize factor of frames before face detection or 'auto'
+    'det_scale': 1.0,
+    # facedetector.detection_store.DetectionStore that keeps face detections across runs
+    'detection_store': None,
+    # reduced precision of the face detector and classifier forward passes, bf16 or fp16, None uses fp32
+    'precision': None,
+    # load the face detector from its TorchScript export, which is created on first use
+    'torchscript': False,
+    # load the INT8 face detector created by quantize_face_detector, CPU only
+    'int8': False,
+    # deployment variant of the face detector without the landmark head, landmarks are NaN
+    'deploy': False,
+    # FPN levels that the deployment variant keeps, 0 (stride 8) to 2 (stride 32), None keeps all
+    'det_levels': None,
+    # detect faces in the previous face box enlarged by this fraction of its size on each side
+    # instead of the whole frame, None detects faces in whole frames
+    'roi': None,
+    # keep only face crops with up to this face margin instead of the full frames after detection,
+    # None keeps the full frames
+    'retain_crops': None,
+}
+
+# autocast data types of the precision option
+PRECISIONS = {'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+# options that change the detected faces, detections are stored per combination of them
+DETECTION_CONFIG = ('detector', 'det_scale', 'detect_bucket', 'dedup', 'track', 'track_min_score')
+
+
+def configure(**kwargs):
+    """
+    Set runtime options of the face detection pipeline.
+    # Arguments:
+        kwargs: Option names and values (see df_retinaface.options).
+    """
+    for key, value in kwargs.items():
+        if key not in options:
+            raise ValueError(f"{key} is not a face detection option.")
+        options[key] = value
+
+
+@contextlib.contextmanager
+def configured(**kwargs):
+    """Context in which runtime options are set like with configure(), they are restored afterwards."""
+    previous = {key: options[key] for key in kwargs if key in options}
+    try:
+        configure(**kwargs)
+        yield
+    finally:
+        options.update(previous)
+
+
+def get_device():
+    """Configured device or the GPU if available."""
+    device = options['device']
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return torch.device(device)
+
+
+def autocast(device=None):
+    """
+    Autocast context for forward passes in the configured precision on the device.
+    bf16 runs on CPU and GPU, fp16 only on GPU. Without reduced precision nothing changes.
+    """
+    precision = options['precision']
+    if precision is None:
+        return contextlib.nullcontext()
+    if precision not in PRECISIONS:
+        raise ValueError(
+            f"{precision} precision does not exist. Choose \"bf16\" or \"fp16\".")
+    if not hasattr(torch, 'autocast'):
+        raise RuntimeError("Reduced precision requires pytorch 1.10 or newer.")
+    device = torch.device(get_device() if device is None else device)
+    if device.type == 'cpu' and precision == 'fp16':
+        raise ValueError("fp16 is only available on the GPU, use bf16 on the CPU.")
+    return torch.autocast(device_type=device.type, dtype=PRECISIONS[precision])
+
+
+def buffer(name, shape, dtype=np.uint8):
+    """Array from the configured buffer pool or a new array if no pool is configured."""
+    pool = options['buffer_pool']
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.get(name, shape, dtype)
+
+
+def _frame_buffer(cap, num_frames):
+    """Buffer for num_frames frames of the video or None if the frame size is unknown."""
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    if options['buffer_pool'] is None or height <= 0 or width <= 0:
+        return None
+    return buffer('frames', (num_frames, height, width, 3))
+
 
 def check_keys(model, pretrained_state_dict):
     ckpt_keys = set(pretrained_state_dict.keys())
@@ -56,11 +213,16 @@ def load_model(model, pretrained_path, load_to_cpu):
     return model
 
 
-def my_detector(cfg_mnet, cfg_re50, inp, model_path, cpu=False):
+def my_detector(cfg_mnet, cfg_re50, inp, model_path, cpu=False, device=None):
     """Create the RetinaFace Detector. """
     torch.set_grad_enabled(False)
+    if device is None:
+        device = torch.device("cpu" if cpu else "cuda")
+    cpu = torch.device(device).type == 'cpu'
     cfg = None
     cfg_mnet['pretrain'] = False
+    # the checkpoint replaces the imagenet weights of the backbone
+    cfg_re50['pretrain'] = False
     if inp == "mobile0.25":
         cfg = cfg_mnet
     elif inp == "resnet50":
@@ -71,96 +233,234 @@ def my_detector(cfg_mnet, cfg_re50, inp, model_path, cpu=False):
     net.eval()
     # print('Finished loading RetinaFace face detector!')
     # print(net)
-    cudnn.benchmark = True
-    device = torch.device("cpu" if cpu else "cuda")
+    if not cpu:
+        cudnn.benchmark = True
     net = net.to(device)
     return net, cfg
 
 
-def detect_face_from_frame(frame, net, cfg):
+def detection_scale(height, width, det_scale=None):
+    """
+    Factor by which a frame is resized before face detection.
+    # Arguments:
+        det_scale: Fixed factor or 'auto' to downscale frames whose longer side
+                   exceeds AUTO_DET_MAX_SIDE pixels. Defaults to the configured option.
+    """
+    if det_scale is None:
+        det_scale = options['det_scale']
+    if det_scale == 'auto':
+        return min(1.0, AUTO_DET_MAX_SIDE / max(height, width))
+    return float(det_scale)
+
+
+def detection_size(height, width, det_scale=None):
+    """Height and width of a frame after resizing it for face detection."""
+    resize = detection_scale(height, width, det_scale)
+    if resize != 1:
+        return int(np.rint(height * resize)), int(np.rint(width * resize))
+    return height, width
+
+
+def input_size(height, width, det_scale=None):
+    """
+    Face detector input size of a frame. If bucketing is configured, the resized frame
+    is padded to a multiple of detect_bucket pixels, so that frames of similar size share batches.
+    """
+    height, width = detection_size(height, width, det_scale)
+    bucket = options['detect_bucket']
+    if bucket is None:
+        return height, width
+    return -(-height // bucket) * bucket, -(-width // bucket) * bucket
+
+
+def detect_face_from_frame(frame, net, cfg, det_scale=None):
     """Face detection in single frame."""
-    resize = 1
-    top_k = 1
-    keep_top_k = 1
-    confidence_threshold = 0.9
-    nms_threshold = 0.4
-    save_image = True
-    vis_thres = 0.6
-    # run on gpu
-    device = "cuda"
-    img_raw = frame
-    img = np.float32(img_raw)
-    im_height, im_width, _ = img.shape
-    scale = torch.Tensor(
-        [img.shape[1], img.shape[0], img.shape[1], img.shape[0]])
-    img -= (104, 117, 123)
-    img = img.transpose(2, 0, 1)
-    img = torch.from_numpy(img).unsqueeze(0)
+    return detect_batch([frame], net, cfg, det_scale)[0]
+
+
+def detect_batch(frames, net, cfg, det_scale=None, size=None):
+    """
+    Face detection in frames with one forward pass.
+    Returns an [img_raw, dets] pair per frame like detect_face_from_frame.
+    # Arguments:
+        size: Detector input height and width. Resized frames that are smaller are padded
+              at the bottom and right. Defaults to the detection size of the first frame,
+              then all frames must have the same size.
+    """
+    device = get_device()
+    sizes = [detection_size(frame.shape[0], frame.shape[1], det_scale)
+             for frame in frames]
+    if size is None:
+        size = sizes[0]
+    im_height, im_width = size
+    inp = buffer('det_input', (len(frames), 3, im_height, im_width), np.float32)
+    scales = []
+    for idx, img_raw in enumerate(frames):
+        raw_height, raw_width, _ = img_raw.shape
+        height, width = sizes[idx]
+        # faces are large, so the detector can run on a downscaled frame
+        resize = detection_scale(raw_height, raw_width, det_scale)
+        if resize != 1:
+            img = cv2.resize(img_raw, None, buffer('det_resized', (height, width, 3)),
+                             fx=resize, fy=resize, interpolation=cv2.INTER_LINEAR)
+        else:
+            img = img_raw
+        # subtract the mean and turn to channels first in one pass into the input buffer
+        np.subtract(img.transpose(2, 0, 1), DET_MEAN, out=inp[idx, :, :height, :width])
+        if (height, width) != size:
+            # padding has the mean color, which is zero after subtracting the mean
+            inp[idx, :, height:] = 0
+            inp[idx, :, :height, width:] = 0
+        # decoded boxes are relative to the input size, scaling them by the frame size
+        # maps them back to full resolution, padding makes the input larger than the frame
+        scales.append((raw_width if width == im_width else raw_width * im_width / width,
+                       raw_height if height == im_height else raw_height * im_height / height))
+    img = torch.from_numpy(inp)
     img = img.to(device)
+    scale = torch.Tensor([[x, y, x, y] for x, y in scales])
     scale = scale.to(device)
-
-    tic = time.time()
-    loc, conf, landms = net(img)  # forward pass
-
-    priorbox = PriorBox(cfg, image_size=(im_height, im_width))
-    priors = priorbox.forward()
-    priors = priors.to(device)
-    prior_data = priors.data
-    boxes = decode(loc.data.squeeze(0), prior_data, cfg['variance'])
-    boxes = boxes * scale / resize
-    boxes = boxes.cpu().numpy()
-    scores = conf.squeeze(0).data.cpu().numpy()[:, 1]
-    landms = decode_landm(landms.data.squeeze(0), prior_data, cfg['variance'])
-    scale1 = torch.Tensor([img.shape[3], img.shape[2], img.shape[3], img.shape[2],
-                           img.shape[3], img.shape[2], img.shape[3], img.shape[2],
-                           img.shape[3], img.shape[2]])
+    scale1 = torch.Tensor([[x, y] * 5 for x, y in scales])
     scale1 = scale1.to(device)
-    landms = landms * scale1 / resize
-    landms = landms.cpu().numpy()
-
-    # ignore low scores
-    inds = np.where(scores > confidence_threshold)[0]
-    boxes = boxes[inds]
-    landms = landms[inds]
-    scores = scores[inds]
-
-    # keep top-K before NMS
-    order = scores.argsort()[::-1][:top_k]
-    boxes = boxes[order]
-
-    landms = landms[order]
-    scores = scores[order]
-    # do NMS
-    dets = np.hstack((boxes, scores[:, np.newaxis])).astype(
-        np.float32, copy=False)
-    keep = py_cpu_nms(dets, nms_threshold)
-    dets = dets[keep, :]
-    landms = landms[keep]
-
-    # keep top-K faster NMS
-    dets = dets[:keep_top_k, :]
-    landms = landms[:keep_top_k, :]
-
-    dets = np.concatenate((dets, landms), axis=1)
+
+    with autocast(device):
+        output = net(img)  # forward pass
+    # decoding needs full precision, the deployment variant has no landmarks
+    loc, conf = output[0].float(), output[1].float()
+    landms = output[2].float() if len(output) > 2 else None
+
+    # anchors are generated once per image size
+    prior_data = cached_priors(cfg, (im_height, im_width), device)
+    if DET_TOP_K == 1:
+        dets = _top_faces(loc, conf, landms, prior_data, scale, scale1, cfg)
+    else:
+        dets = _batch_faces(loc, conf, landms, prior_data, scale, scale1, cfg)
     # image, box,score,landmarks pairs
-    return [img_raw, dets]
+    return [[img_raw, dets[idx]] for idx, img_raw in enumerate(frames)]
 
 
-def detect_faces(net, video, cfg, num_frames):
+def _top_faces(loc, conf, landms, prior_data, scale, scale1, cfg):
     """
-    Detect faces in video frames.
+    Top face box, score and landmarks of each image of a batch.
+    Only the highest scoring prior of each image is decoded, without sorting and NMS,
+    and the detections of all images are copied from the device at once.
+    """
+    scores = conf.data[:, :, 1]
+    # the last of equal top scores, as the descending argsort picks it
+    best = scores.size(1) - 1 - scores.flip(1).argmax(1)
+    images = torch.arange(scores.size(0), device=scores.device)
+    priors = prior_data[best]
+    boxes = decode(loc.data[images, best], priors, cfg['variance']) * scale
+    if landms is None:
+        landms = torch.full_like(scale1, float('nan'))
+    else:
+        landms = decode_landm(landms.data[images, best], priors, cfg['variance']) * scale1
+    dets = torch.cat((boxes, scores[images, best].unsqueeze(1), landms), 1).cpu().numpy()
+    # images without a score above the threshold have no face
+    found = dets[:, 4] > DET_CONFIDENCE
+    return [dets[idx:idx + 1] if found[idx] else dets[idx:idx] for idx in range(len(dets))]
 
-    # parts from https://www.kaggle.com/unkownhihi/dfdc-lrcn-inference
-    # APACHE LICENSE, VERSION 2.0
-    # adapted by Christopher Otto
 
+def _batch_faces(loc, conf, landms, prior_data, scale, scale1, cfg):
+    """
+    Decode the detector output of a batch to the top_k face boxes, scores and landmarks of each image.
+    Thresholding, decoding and NMS of all images run on the device at once and the
+    detections of all images are copied from the device at once.
     """
+    num_images = conf.size(0)
+    scores = conf.data[:, :, 1]
+    # ignore low scores before decoding
+    images, inds = torch.nonzero(scores > DET_CONFIDENCE, as_tuple=True)
+    # keep top-K of each image before NMS
+    order = _top_per_image(images, scores[images, inds], num_images)
+    images, inds = images[order], inds[order]
+    boxes = decode(loc.data[images, inds], prior_data[inds], cfg['variance']) * scale[images]
+    # py_cpu_nms counts the last pixel row and column to the box
+    keep = batched_nms(boxes + boxes.new_tensor([0, 0, 1, 1]), scores[images, inds],
+                       images, DET_NMS_THRESHOLD)
+    # keep top-K of each image after NMS
+    keep = keep[_top_per_image(images[keep], scores[images, inds][keep], num_images)]
+    images, inds = images[keep], inds[keep]
+    if landms is None:
+        landms = torch.full((len(keep), 10), float('nan'), device=boxes.device)
+    else:
+        landms = decode_landm(landms.data[images, inds], prior_data[inds], cfg['variance']) * scale1[images]
+    dets = torch.cat((boxes[keep], scores[images, inds].unsqueeze(1), landms), 1).cpu().numpy()
+    counts = torch.bincount(images, minlength=num_images).cpu().numpy()
+    return np.split(dets, np.cumsum(counts)[:-1])
+
+
+def _top_per_image(images, scores, num_images):
+    """Positions of the DET_TOP_K highest scores of each image, grouped by image in decreasing score order."""
+    order = scores.argsort(descending=True)
+    order = order[images[order].sort(stable=True)[1]]
+    counts = torch.bincount(images, minlength=num_images)
+    rank = torch.arange(len(order), device=order.device) - (torch.cumsum(counts, 0) - counts)[images[order]]
+    return order[rank < DET_TOP_K]
+
+
+def sample_indices(frame_len, num_frames):
+    """Indices of num_frames frames that are equally spaced over the video."""
+    return np.linspace(
+        0, frame_len, num_frames, endpoint=False, dtype=np.int64)
+
+
+def read_frames(video, num_frames, sampling=None, return_indices=False):
+    """
+    Read num_frames equally spaced frames from a video.
+    If a frame cache is configured, frames are read from the cache when available.
+    If a video index is configured, the frame count is taken from the index.
+    # Arguments:
+        video: Path to the video.
+        num_frames: Number of frames that are sampled from the video.
+        sampling: 'grab' decodes every frame up to the last sampled frame,
+                  'seek' jumps to the sampled frames. Both return the same frames.
+        return_indices: Return the indices of the sampled frames as well.
+    """
+    if sampling is None:
+        sampling = options['sampling']
+    cache = options['frame_cache']
+    index = options['video_index']
+    frame_len = None if index is None else index.frame_count(video)
+    if cache is not None:
+        # cached frames are read without opening the video
+        if frame_len is None:
+            frame_len = cache.frame_count(video)
+        if frame_len is not None:
+            search_frames = sample_indices(frame_len, num_frames)
+            frames = cache.get(video, search_frames)
+            if frames is not None:
+                return (frames, search_frames) if return_indices else frames
     cap = cv2.VideoCapture(video)
-    # get frames in video
-    frame_len = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_len is None:
+        # get frames in video
+        frame_len = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     # choose num frames (20) equally spaced from video
-    search_frames = np.linspace(
-        0, frame_len, num_frames, endpoint=False, dtype=np.int64)
+    search_frames = sample_indices(frame_len, num_frames)
+    out = _frame_buffer(cap, num_frames)
+    if sampling == 'grab':
+        frames = _grab_frames(cap, frame_len, search_frames, num_frames, out)
+    elif sampling == 'seek':
+        frames, cap = _seek_frames(
+            cap, video, frame_len, search_frames, num_frames, out)
+    else:
+        raise ValueError(
+            f"{sampling} sampling does not exist. Choose \"grab\" or \"seek\".")
+    cap.release()
+    if cache is not None:
+        cache.put_frame_count(video, frame_len)
+        cache.put(video, search_frames, frames)
+    return (frames, search_frames) if return_indices else frames
+
+
+def _grab_frames(cap, frame_len, search_frames, num_frames, out=None):
+    """
+    Decode every frame and retrieve the sampled ones.
+    Frames are retrieved into out if a frame buffer is given.
+
+    # parts from https://www.kaggle.com/unkownhihi/dfdc-lrcn-inference
+    # APACHE LICENSE, VERSION 2.0
+    # adapted by Christopher Otto
+    """
     frames = []
     count = 0
     for idx in range(frame_len):
@@ -171,10 +471,9 @@ def detect_faces(net, video, cfg, num_frames):
         # retrieve frame if in search frames
         if idx >= search_frames[count]:
             # if successful retrieve the frame
-            _, frame = cap.retrieve()
+            _, frame = cap.retrieve(None if out is None else out[count])
             if frame is None:
                 continue
-            frame = detect_face_from_frame(frame, net, cfg)
             frames.append(frame)
             count += 1
             # break if num_frames extracted
@@ -183,9 +482,525 @@ def detect_faces(net, video, cfg, num_frames):
     return frames
 
 
-def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
+def _seek_frames(cap, video, frame_len, search_frames, num_frames, out=None):
     """
-    Extract frames from video and save image with frames.
+    Seek to the sampled frames instead of decoding the whole video.
+    Frames closer than SEEK_MIN_GAP to the previous frame are decoded forward.
+    Returns the same frames as _grab_frames and the capture, which
+    is reopened if the container does not seek accurately.
+    """
+    frames = []
+    count = 0
+    # index of the frame that the next grab returns
+    pos = 0
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    # seeks can only be checked with the frame rate
+    seekable = fps > 0
+    while count < num_frames:
+        # frames are taken consecutively if the video has less frames than sampled
+        target = max(int(search_frames[count]), pos)
+        if target >= frame_len:
+            break
+        # a seek restarts decoding at the preceding keyframe,
+        # so short gaps are cheaper to decode forward
+        success = False
+        if seekable and target - pos > SEEK_MIN_GAP:
+            success = _seek_grab(cap, target, fps)
+            if success:
+                pos = target + 1
+            else:
+                # container seeks inaccurately, decode forward from the start instead
+                cap.release()
+                cap = cv2.VideoCapture(video)
+                pos = 0
+                seekable = False
+        if not success:
+            # grab forward to the target
+            while pos < target:
+                cap.grab()
+                pos += 1
+            success = cap.grab()
+            pos += 1
+            if not success:
+                continue
+        _, frame = cap.retrieve(None if out is None else out[count])
+        if frame is None:
+            continue
+        frames.append(frame)
+        count += 1
+    return frames, cap
+
+
+def _seek_grab(cap, target, fps):
+    """
+    Seek to frame target and grab it.
+    Returns whether the decoded frame is the target according to its timestamp,
+    as containers with inaccurate seeking decode a frame near the target instead.
+    """
+    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    if not cap.grab():
+        return False
+    decoded = int(round(cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000))
+    return decoded == target
+
+
+def coarse_to_fine(num_frames):
+    """Sample positions ordered from coarse to fine, e.g. 0, 10, 5, 15, 2, 4, ... for 20 frames."""
+    order = []
+    seen = set()
+    step = num_frames
+    while step >= 1:
+        for pos in range(0, num_frames, step):
+            if pos not in seen:
+                seen.add(pos)
+                order.append(pos)
+        step //= 2
+    return order
+
+
+def _sample_targets(search_frames, frame_len):
+    """Frame indices that read_frames returns for the sampled indices."""
+    targets = []
+    pos = 0
+    for index in search_frames:
+        # frames are taken consecutively if the video has less frames than sampled
+        target = max(int(index), pos)
+        if target >= frame_len:
+            break
+        targets.append(target)
+        pos = target + 1
+    return targets
+
+
+def iter_frames(video, num_frames, order):
+    """
+    Read the sampled frames of a video one at a time, so that reading can stop early.
+    Yields the sample position and the frame, which is the same frame as in read_frames.
+    # Arguments:
+        video: Path to the video.
+        num_frames: Number of frames that are sampled from the video.
+        order: Sample positions in the order they are read, e.g. coarse_to_fine(num_frames).
+    """
+    cache = options['frame_cache']
+    index = options['video_index']
+    frame_len = None if index is None else index.frame_count(video)
+    if cache is not None:
+        if frame_len is None:
+            frame_len = cache.frame_count(video)
+        if frame_len is not None:
+            frames = cache.get(video, sample_indices(frame_len, num_frames))
+            if frames is not None:
+                for sample in order:
+                    if sample < len(frames):
+                        yield sample, frames[sample]
+                return
+    cap = cv2.VideoCapture(video)
+    try:
+        if frame_len is None:
+            frame_len = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        targets = _sample_targets(
+            sample_indices(frame_len, num_frames), frame_len)
+        out = _frame_buffer(cap, num_frames)
+        # index of the frame that the next grab returns
+        pos = 0
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        # seeks can only be checked with the frame rate
+        seekable = fps > 0
+        for sample in order:
+            if sample >= len(targets):
+                continue
+            target = targets[sample]
+            success = False
+            if seekable and (target < pos or target - pos > SEEK_MIN_GAP):
+                success = _seek_grab(cap, target, fps)
+                if success:
+                    pos = target + 1
+                else:
+                    # container seeks inaccurately, decode forward from the start instead
+                    seekable = False
+                    cap.release()
+                    cap = cv2.VideoCapture(video)
+                    pos = 0
+            elif target < pos:
+                cap.release()
+                cap = cv2.VideoCapture(video)
+                pos = 0
+            if not success:
+                # grab forward to the target
+                while pos < target:
+                    cap.grab()
+                    pos += 1
+                success = cap.grab()
+                pos += 1
+                if not success:
+                    continue
+            _, frame = cap.retrieve(None if out is None else out[sample])
+            if frame is None:
+                continue
+            yield sample, frame
+    finally:
+        cap.release()
+
+
+def detect_faces(net, video, cfg, num_frames, sampling=None):
+    """
+    Detect faces in video frames.
+
+    # parts from https://www.kaggle.com/unkownhihi/dfdc-lrcn-inference
+    # APACHE LICENSE, VERSION 2.0
+    # adapted by Christopher Otto
+
+    """
+    frames, indices = read_frames(
+        video, num_frames, sampling=sampling, return_indices=True)
+    return detect_video_frames(net, video, cfg, frames, indices)
+
+
+def detect_faces_of_videos(net, videos, cfg, num_frames, sampling=None):
+    """
+    Detect faces in the frames of several videos, batches of the face detector
+    combine frames of all videos with the same detector input size.
+    Returns the faces of each video as detect_faces does.
+    """
+    sampled = [read_frames(video, num_frames, sampling=sampling, return_indices=True)
+               for video in videos]
+    return detect_videos(net, videos, cfg, [frames for frames, _ in sampled],
+                         [indices for _, indices in sampled])
+
+
+def detect_video_frames(net, video, cfg, frames, indices):
+    """
+    Detect faces in the sampled frames of a video.
+    If a detection store is configured, stored detections are used when available
+    and new detections are added to the store.
+    # Arguments:
+        frames: Frames returned by read_frames.
+        indices: Indices of the sampled frames in the video.
+    """
+    return detect_videos(net, [video], cfg, [frames], [indices])[0]
+
+
+def detect_videos(net, videos, cfg, videos_frames, videos_indices):
+    """Detect faces in the sampled frames of several videos like detect_video_frames."""
+    store = options['detection_store']
+    faces = [None] * len(videos)
+    if store is not None:
+        config = detection_config()
+        for pos, (video, frames, indices) in enumerate(zip(videos, videos_frames, videos_indices)):
+            stored = store.get(config, video, indices, len(frames))
+            if stored is not None:
+                faces[pos] = [[frame, dets] if source == 'detected' else [frame, dets, source]
+                              for frame, (dets, source) in zip(frames, stored)]
+    missing = [pos for pos, video_faces in enumerate(faces) if video_faces is None]
+    detected = detect_frames_of_videos(
+        [videos_frames[pos] for pos in missing], net, cfg)
+    for pos, video_faces in zip(missing, detected):
+        faces[pos] = video_faces
+        if store is not None:
+            store.put(config, videos[pos], videos_indices[pos], video_faces)
+    if options['retain_crops'] is not None:
+        # release the full frames, only the faces are cropped later
+        faces = [retain_face_crops(video_faces, options['retain_crops']) for video_faces in faces]
+    return faces
+
+
+def detection_config():
+    """Options that the detected faces depend on."""
+    config = {key: options[key] for key in DETECTION_CONFIG}
+    if config['track'] is None:
+        del config['track_min_score']
+    if options['precision'] is not None:
+        config['precision'] = options['precision']
+    if options['int8']:
+        config['int8'] = True
+    if options['deploy']:
+        config['deploy'] = True
+        config['det_levels'] = None if options['det_levels'] is None else sorted(options['det_levels'])
+    if options['roi'] is not None:
+        config['roi'] = options['roi']
+    return config
+
+
+def detect_frames(frames, net, cfg, batch_size=None):
+    """
+    Detect faces in frames that were read from a video.
+    Frames are detected in batches of batch_size frames with the same detector input size.
+    If duplicate skipping is configured, frames that are nearly identical to the
+    last detected frame reuse its detection and get 'duplicate' as third entry.
+    If tracking is configured, faces are only detected in keyframes and the face box
+    is tracked to the frames between, which get 'tracked' as third entry.
+    """
+    return detect_frames_of_videos([frames], net, cfg, batch_size)[0]
+
+
+def detect_frames_of_videos(videos_frames, net, cfg, batch_size=None):
+    """
+    Detect faces in the frames of several videos like detect_frames.
+    Batches combine the frames of all videos, so that the face detector sees full batches
+    of few different input sizes.
+    """
+    if batch_size is None:
+        batch_size = options['detect_batch_size']
+    threshold = options['dedup']
+    track = options['track']
+    # index of the detected frame that each frame duplicates or None
+    videos_duplicates = []
+    videos_detect = []
+    keyframes = []
+    for vid, frames in enumerate(videos_frames):
+        duplicates = [None] * len(frames)
+        if threshold is not None:
+            duplicates = find_duplicates(frames, threshold)
+        detect = [(vid, idx) for idx, dup in enumerate(duplicates) if dup is None]
+        videos_duplicates.append(duplicates)
+        videos_detect.append(detect)
+        keyframes += detect if track is None else detect[::track]
+    if options['roi'] is None:
+        dets = _detect_indices(videos_frames, keyframes, net, cfg, batch_size)
+    else:
+        dets = _detect_regions(videos_frames, keyframes, net, cfg, batch_size)
+    tracked = set()
+    if track is not None:
+        # carry the face box from frame to frame, starting at the keyframes
+        for detect in videos_detect:
+            prev_key = None
+            for key in detect:
+                if key not in dets:
+                    frames = videos_frames[key[0]]
+                    box = track_face(frames[prev_key[1]], dets[prev_key], frames[key[1]])
+                    if box is None:
+                        # tracking lost the face, detect it again
+                        if options['roi'] is None:
+                            dets.update(_detect_indices(
+                                videos_frames, [key], net, cfg, batch_size))
+                        else:
+                            dets.update(_detect_regions(videos_frames, [key], net, cfg, batch_size,
+                                                        prev_dets={key[0]: dets[prev_key]}))
+                    else:
+                        dets[key] = box
+                        tracked.add(key)
+                prev_key = key
+    videos_faces = []
+    for vid, (frames, duplicates) in enumerate(zip(videos_frames, videos_duplicates)):
+        faces = []
+        for idx, frame in enumerate(frames):
+            if duplicates[idx] is not None:
+                faces.append([frame, dets[(vid, duplicates[idx])].copy(), 'duplicate'])
+            elif (vid, idx) in tracked:
+                faces.append([frame, dets[(vid, idx)], 'tracked'])
+            else:
+                faces.append([frame, dets[(vid, idx)]])
+        videos_faces.append(faces)
+    return videos_faces
+
+
+def _detect_indices(videos_frames, keys, net, cfg, batch_size):
+    """
+    Face detections of the frames at (video, index) keys in batches of frames
+    with the same detector input size.
+    """
+    buckets = {}
+    for key in keys:
+        height, width = videos_frames[key[0]][key[1]].shape[:2]
+        buckets.setdefault(input_size(height, width), []).append(key)
+    dets = {}
+    for size, bucket in buckets.items():
+        for start in range(0, len(bucket), batch_size):
+            chunk = bucket[start:start + batch_size]
+            faces = detect_batch([videos_frames[vid][idx] for vid, idx in chunk],
+                                 net, cfg, size=size)
+            for key, face in zip(chunk, faces):
+                dets[key] = face[1]
+    return dets
+
+
+def _detect_regions(videos_frames, keys, net, cfg, batch_size, prev_dets=None):
+    """
+    Face detections of the frames at (video, index) keys like _detect_indices, but faces are
+    detected in a region around the face of the previous key of the same video.
+    prev_dets maps videos to the faces before their first key, else the first key of each video
+    is detected in the whole frame, as are frames without a face in their region.
+    """
+    videos_keys = {}
+    for key in keys:
+        videos_keys.setdefault(key[0], []).append(key)
+    dets = {}
+    # faces of the previous key of each video
+    prev_faces = dict(prev_dets or {})
+    # the n-th keys of all videos are detected together, since each region depends on the previous face
+    for step in range(max((len(vid_keys) for vid_keys in videos_keys.values()), default=0)):
+        step_keys = [vid_keys[step] for vid_keys in videos_keys.values() if step < len(vid_keys)]
+        regions = {}
+        for key in step_keys:
+            if key[0] in prev_faces:
+                region = face_region(videos_frames[key[0]][key[1]], prev_faces[key[0]], options['roi'])
+                if region is not None:
+                    regions[key] = region
+        chunks = list(regions)
+        for start in range(0, len(chunks), batch_size):
+            chunk = chunks[start:start + batch_size]
+            faces = detect_batch([regions[key][0] for key in chunk], net, cfg,
+                                 det_scale=1.0, size=(ROI_SIZE, ROI_SIZE))
+            for key, face in zip(chunk, faces):
+                if len(face[1]) > 0:
+                    dets[key] = region_to_frame(face[1], *regions[key][1:])
+        dets.update(_detect_indices(videos_frames, [key for key in step_keys if key not in dets],
+                                    net, cfg, batch_size))
+        prev_faces.update((key[0], dets[key]) for key in step_keys)
+    return dets
+
+
+def face_region(frame, dets, margin):
+    """
+    Region of the frame around the face box, enlarged by margin times its size on each side
+    and resized so that its longer side has ROI_SIZE pixels.
+    Returns the resized region, its top left corner in the frame and the x and y resize factors
+    or None if there is no face or the region is too small.
+    """
+    if len(dets) == 0:
+        return None
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = dets[0, :4]
+    side = max(x2 - x1, y2 - y1) * (1 + 2 * margin)
+    if not np.isfinite(side) or side < 8:
+        return None
+    # square region around the center of the box, moved into the frame at its borders
+    rx1 = int(max(0, min((x1 + x2 - side) / 2, width - side)))
+    ry1 = int(max(0, min((y1 + y2 - side) / 2, height - side)))
+    rx2, ry2 = int(min(width, rx1 + side)), int(min(height, ry1 + side))
+    if rx2 - rx1 < 8 or ry2 - ry1 < 8:
+        return None
+    resize = ROI_SIZE / max(rx2 - rx1, ry2 - ry1)
+    region_width = min(ROI_SIZE, int(round((rx2 - rx1) * resize)))
+    region_height = min(ROI_SIZE, int(round((ry2 - ry1) * resize)))
+    region = cv2.resize(frame[ry1:ry2, rx1:rx2], (region_width, region_height),
+                        interpolation=cv2.INTER_LINEAR)
+    return region, (rx1, ry1), (region_width / (rx2 - rx1), region_height / (ry2 - ry1))
+
+
+def region_to_frame(dets, corner, resize):
+    """Map face detections in a region returned by face_region back to frame coordinates."""
+    dets = dets.copy()
+    # x and y of the box corners and the five landmarks
+    dets[:, [0, 2, 5, 7, 9, 11, 13]] = dets[:, [0, 2, 5, 7, 9, 11, 13]] / resize[0] + corner[0]
+    dets[:, [1, 3, 6, 8, 10, 12, 14]] = dets[:, [1, 3, 6, 8, 10, 12, 14]] / resize[1] + corner[1]
+    return dets
+
+
+def track_face(prev_frame, prev_dets, frame, min_score=None):
+    """
+    Move the face box of the previous frame to the frame with template matching
+    in a region around the box.
+    Returns the moved box, score and landmarks or None if the face can not be tracked reliably.
+    """
+    if min_score is None:
+        min_score = options['track_min_score']
+    if len(prev_dets) == 0:
+        return None
+    height, width = frame.shape[:2]
+    x1, y1, x2, y2 = [int(v) for v in prev_dets[0, :4]]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    box_width, box_height = x2 - x1, y2 - y1
+    if box_width < 8 or box_height < 8:
+        return None
+    margin_x = int(box_width * TRACK_MARGIN)
+    margin_y = int(box_height * TRACK_MARGIN)
+    sx1, sy1 = max(0, x1 - margin_x), max(0, y1 - margin_y)
+    sx2, sy2 = min(width, x2 + margin_x), min(height, y2 + margin_y)
+    # match small grayscale images, the face only has to be found roughly
+    scale = min(1.0, TRACK_TEMPLATE_SIZE / max(box_width, box_height))
+    template = _track_image(prev_frame[y1:y2, x1:x2], scale)
+    region = _track_image(frame[sy1:sy2, sx1:sx2], scale)
+    if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+        return None
+    result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, loc = cv2.minMaxLoc(result)
+    if not score >= min_score:
+        return None
+    dx = int(round(sx1 + loc[0] / scale)) - x1
+    dy = int(round(sy1 + loc[1] / scale)) - y1
+    if scale < 1:
+        # refine the shift at full resolution around the match of the small images
+        step = int(np.ceil(1 / scale))
+        rx1, ry1 = max(0, x1 + dx - step), max(0, y1 + dy - step)
+        rx2 = min(width, x1 + dx + box_width + step)
+        ry2 = min(height, y1 + dy + box_height + step)
+        region = _track_image(frame[ry1:ry2, rx1:rx2], 1)
+        template = _track_image(prev_frame[y1:y2, x1:x2], 1)
+        if region.shape[0] >= template.shape[0] and region.shape[1] >= template.shape[1]:
+            result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+            _, _, _, loc = cv2.minMaxLoc(result)
+            dx, dy = rx1 + loc[0] - x1, ry1 + loc[1] - y1
+    dets = prev_dets[:1].copy()
+    # x and y of the box corners and the five landmarks
+    dets[:, [0, 2, 5, 7, 9, 11, 13]] += dx
+    dets[:, [1, 3, 6, 8, 10, 12, 14]] += dy
+    return dets
+
+
+def _track_image(img, scale):
+    """Grayscale image resized by scale for template matching."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if scale == 1:
+        return gray
+    return cv2.resize(gray, (max(1, int(round(gray.shape[1] * scale))), max(1, int(round(gray.shape[0] * scale)))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def thumbnail(img):
+    """Small grayscale version of an image that is compared to find duplicates."""
+    small = cv2.resize(img, (THUMBNAIL_SIZE, THUMBNAIL_SIZE),
+                       interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+def frame_difference(thumb, other_thumb):
+    """Mean absolute difference of two thumbnails in gray values (0-255)."""
+    return float(np.mean(np.abs(thumb - other_thumb)))
+
+
+def find_duplicates(imgs, threshold=None):
+    """
+    Index of the earlier image that each image duplicates or None.
+    Images are compared to the last image that is no duplicate.
+    """
+    if threshold is None:
+        threshold = options['dedup']
+    duplicates = []
+    ref_idx = None
+    ref_thumb = None
+    for idx, img in enumerate(imgs):
+        thumb = thumbnail(img)
+        if ref_thumb is not None and frame_difference(thumb, ref_thumb) <= threshold:
+            duplicates.append(ref_idx)
+            continue
+        ref_idx = idx
+        ref_thumb = thumb
+        duplicates.append(None)
+    return duplicates
+
+
+def detection_info(faces):
+    """
+    Number of frames of a video that faces were detected in, that reused the detection
+    of a duplicate frame and that the face was tracked to, if these modes are enabled.
+    """
+    info = {}
+    sources = [face[2] if len(face) > 2 else 'detected' for face in faces]
+    if options['dedup'] is not None or options['track'] is not None:
+        info['Detected'] = sources.count('detected')
+    if options['dedup'] is not None:
+        info['Skipped'] = sources.count('duplicate')
+    if options['track'] is not None:
+        info['Tracked'] = sources.count('tracked')
+    return info
+
+
+def face_boxes(faces, face_margin):
+    """
+    Box with margin that the face of each frame is cropped to, faces as returned by detect_faces.
+    Frames without a face keep the box of the previous frame, None before the first face.
 
     # parts from https://github.com/biubug6/Pytorch_Retinaface
 
@@ -193,15 +1008,17 @@ def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
     """
     # threshold for confidence in face that is required to confirm it as face
     thresh = 0.6
-    imgs_result = []
-    max_height = 0
-    max_width = 0
-    for idx, face in enumerate(faces):
-        img_raw = face[0]
-        for b in face[1]:
+    b = None
+    for face in faces:
+        dets = face[1]
+        if len(face) > 3:
+            # retained face crops have their detections in crop coordinates
+            dets = region_to_frame(dets, face[3][:2], (1, 1))
+        for b in dets:
             if b[4] < thresh:
                 continue
-            b = list(map(int, b))
+            # landmarks are NaN without the landmark head, only the box is used
+            b = list(map(int, b[:5]))
             # add 100*margin% around the face as recommended here:
             # https://www.kaggle.com/c/deepfake-detection-challenge/discussion/140236
             # and here https://www.kaggle.com/c/deepfake-detection-challenge/discussion/145721
@@ -220,12 +1037,76 @@ def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
             else:
                 b = [b[0], b[1],
                      b[2], b[3]]
+        yield b
+
+
+def face_crops(faces, video, face_margin):
+    """
+    Crop the face with margin from the frames of a video, faces as returned by detect_faces.
+    The crops are views of the frames, crops at the frame borders can be empty.
+    """
+    if any(len(face) > 3 and face[3][4] < face_margin for face in faces):
+        raise ValueError(
+            f"The face margin {face_margin} exceeds the margin of the retained face crops, choose a larger retain_crops margin.")
+    imgs_result = []
+    for idx, (face, b) in enumerate(zip(faces, face_boxes(faces, face_margin))):
+        img_raw = face[0]
         try:
-            img_raw = img_raw[b[1]:b[3], b[0]:b[2]]
-        except:
+            if len(face) > 3:
+                img_raw = _region_crop(img_raw, b, face[3])
+            else:
+                img_raw = img_raw[b[1]:b[3], b[0]:b[2]]
+        except TypeError:
             print(f"No face detected in frame {idx + 1} from video: {video}.")
             continue
         imgs_result.append(img_raw)
+    return imgs_result
+
+
+def _region_crop(crop, b, region):
+    """Crop a box in frame coordinates from a retained face crop, like slicing the frame would."""
+    x, y, height, width, _ = region
+    y1, y2, _ = slice(b[1], b[3]).indices(height)
+    x1, x2, _ = slice(b[0], b[2]).indices(width)
+    if y2 <= y1 or x2 <= x1:
+        return np.empty((max(0, y2 - y1), max(0, x2 - x1), 3), dtype=crop.dtype)
+    return crop[max(0, y1 - y):max(0, y2 - y), max(0, x1 - x):max(0, x2 - x)]
+
+
+def retain_face_crops(faces, margin):
+    """
+    Replace the frames of faces by copies of the region that face_crops crops with a face margin
+    of up to margin, enlarged by RETAIN_HEADROOM of the box size on each side, so that the frames can be released.
+    Returns [crop, dets, source, (x, y, frame height, frame width, margin)] per frame with the
+    detections in crop coordinates and the top left corner of the crop in the frame.
+    """
+    retained = []
+    for face, b in zip(faces, face_boxes(faces, margin)):
+        height, width = face[0].shape[:2]
+        x1 = y1 = x2 = y2 = 0
+        if isinstance(b, list):
+            pad_x = int((b[2] - b[0]) * RETAIN_HEADROOM)
+            pad_y = int((b[3] - b[1]) * RETAIN_HEADROOM)
+            x1, y1 = min(width, max(0, b[0] - pad_x)), min(height, max(0, b[1] - pad_y))
+            x2, y2 = max(x1, min(width, b[2] + pad_x)), max(y1, min(height, b[3] + pad_y))
+        dets = face[1].copy()
+        dets[:, [0, 2, 5, 7, 9, 11, 13]] -= x1
+        dets[:, [1, 3, 6, 8, 10, 12, 14]] -= y1
+        retained.append([face[0][y1:y2, x1:x2].copy(), dets,
+                         face[2] if len(face) > 2 else 'detected', (x1, y1, height, width, margin)])
+    return retained
+
+
+def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
+    """
+    Extract frames from video and save image with frames.
+
+    # adapted by Christopher Otto
+    """
+    imgs_result = face_crops(faces, video, face_margin)
+    max_height = 0
+    max_width = 0
+    for img_raw in imgs_result:
         # to resize images of same video to max height/width
         if img_raw.shape[0] > max_height:
             max_height = img_raw.shape[0]
@@ -235,10 +1116,12 @@ def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
     # resize images of same video to max height/width of img from vid as recommended here:
     # https://www.kaggle.com/c/deepfake-detection-challenge/discussion/140236
     imgs_same_size = []
+    crops = buffer('crops', (len(imgs_result), max_width, max_height, 3))
     for img in imgs_result:
         # bilinear interpolation for upsampling
         try:
-            img = cv2.resize(img, (max_height, max_width))
+            img = cv2.resize(img, (max_height, max_width),
+                             crops[len(imgs_same_size)])
             imgs_same_size.append(img)
         except:
             print("Zero-sized image.")
@@ -253,15 +1136,165 @@ def extract_frames(faces, video, save_to, face_margin, num_frames, test=False):
     return len(imgs_same_size)
 
 
-def load_face_detector(backbone="resnet50", backbone_path=os.getcwd() + "/deepfake_detector/facedetector/retinaface/Resnet50_Final.pth"):
+def load_face_detector(backbone=None, backbone_path=None):
     """
     Detect faces from video frames.
     # Arguments:
-        backbone: Backbone of the face detector.
+        backbone: Backbone of the face detector, resnet50 or mobile0.25.
+                  Defaults to the configured detector tier.
         backbone_path: Weights for face detector model.
 
     # Implementation: Christopher Otto
     """
+    if backbone is None:
+        backbone = options['detector']
+    if backbone not in DETECTOR_WEIGHTS:
+        raise ValueError(
+            f"{backbone} face detector does not exist. Choose \"resnet50\" or \"mobile0.25\".")
+    if backbone_path is None:
+        backbone_path = DETECTOR_DIR + DETECTOR_WEIGHTS[backbone]
+    if options['int8']:
+        return load_quantized_detector(backbone, backbone_path)
+    if options['torchscript']:
+        return load_scripted_detector(backbone, backbone_path, device=get_device())
     detector, config = my_detector(
-        cfg_mnet, cfg_re50, inp=backbone, model_path=backbone_path, cpu=False)
+        *detector_configs(), inp=backbone, model_path=backbone_path, device=get_device())
     return detector, config
+
+
+def detector_configs():
+    """Configs of the mobile0.25 and resnet50 face detectors, reduced to the deployment variant if configured."""
+    if not options['deploy']:
+        return cfg_mnet, cfg_re50
+    return deploy_cfg(cfg_mnet, options['det_levels']), deploy_cfg(cfg_re50, options['det_levels'])
+
+
+def detector_variant():
+    """Name suffix of the exports of the configured face detector variant."""
+    if not options['deploy']:
+        return ''
+    levels = options['det_levels']
+    return '.deploy' + ('' if levels is None else ''.join(str(level) for level in sorted(set(levels))))
+
+
+def scripted_path(backbone_path):
+    """Path of the TorchScript export of face detector weights, it is stored next to the weights."""
+    return os.path.splitext(backbone_path)[0] + detector_variant() + '.torchscript.pt'
+
+
+def _export_source(backbone_path):
+    """Weights and pytorch version that an export was created from, it is outdated when they change."""
+    stat = os.stat(backbone_path)
+    return f"{os.path.basename(backbone_path)}|{stat.st_size}|{stat.st_mtime_ns}|{torch.__version__}"
+
+
+def export_face_detector(backbone, backbone_path):
+    """
+    Trace the face detector to TorchScript and save it next to its weights.
+    The export is only saved if its outputs match the eager face detector.
+    Returns the traced face detector on the CPU and its config.
+    """
+    net, cfg = my_detector(*detector_configs(), inp=backbone,
+                           model_path=backbone_path, device='cpu')
+    with torch.no_grad():
+        traced = torch.jit.trace(net, torch.zeros(EXPORT_CHECK_SIZES[0]))
+    difference = compare_detectors(net, traced)
+    if difference > EXPORT_TOLERANCE:
+        raise RuntimeError(
+            f"TorchScript export of the face detector differs by {difference} from the eager face detector.")
+    # parallel workers load the export, so they must never see a partially written file
+    atomic_write(scripted_path(backbone_path), lambda f: torch.jit.save(
+        traced, f, _extra_files={'source': _export_source(backbone_path)}))
+    return traced, cfg
+
+
+def load_scripted_detector(backbone, backbone_path, device=None):
+    """
+    Face detector from its TorchScript export, which is created if it does not exist
+    or was created from other weights or another pytorch version.
+    """
+    cfg = detector_configs()[0 if backbone == 'mobile0.25' else 1]
+    path = scripted_path(backbone_path)
+    if os.path.exists(path):
+        extra_files = {'source': ''}
+        net = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        if extra_files['source'].decode() == _export_source(backbone_path):
+            torch.set_grad_enabled(False)
+            return net, cfg
+    print("Exporting the face detector to TorchScript.")
+    net, cfg = export_face_detector(backbone, backbone_path)
+    return net.to(device), cfg
+
+
+def quantized_path(backbone_path):
+    """Path of the INT8 face detector that is created from face detector weights."""
+    return os.path.splitext(backbone_path)[0] + detector_variant() + '.int8.pt'
+
+
+def _check_quantization():
+    """Raise an error if pytorch has no FX graph mode quantization with the x86 backend."""
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping  # noqa: F401
+    except ImportError:
+        raise RuntimeError("The INT8 face detector requires pytorch 1.13 or newer.") from None
+
+
+def quantize_face_detector(videos, num_frames=20, backbone=None, backbone_path=None):
+    """
+    Statically quantize the face detector to INT8 for the CPU with FX graph mode
+    post-training quantization and save it as TorchScript next to the weights.
+    The activation ranges are calibrated by detecting faces in the frames of the videos.
+    Returns the quantized face detector and its config.
+    """
+    _check_quantization()
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    if backbone is None:
+        backbone = options['detector']
+    if backbone_path is None:
+        backbone_path = DETECTOR_DIR + DETECTOR_WEIGHTS[backbone]
+    net, cfg = my_detector(*detector_configs(), inp=backbone,
+                           model_path=backbone_path, device='cpu')
+    example = torch.zeros(EXPORT_CHECK_SIZES[0])
+    prepared = prepare_fx(net, get_default_qconfig_mapping('x86'), (example,))
+    device = options['device']
+    options['device'] = 'cpu'
+    try:
+        for video in tqdm(videos, desc="Calibration"):
+            detect_frames(read_frames(video, num_frames), prepared, cfg)
+    finally:
+        options['device'] = device
+    with torch.no_grad():
+        quantized = torch.jit.trace(convert_fx(prepared), example)
+    atomic_write(quantized_path(backbone_path), lambda f: torch.jit.save(
+        quantized, f, _extra_files={'source': _export_source(backbone_path)}))
+    return quantized, cfg
+
+
+def load_quantized_detector(backbone, backbone_path):
+    """INT8 face detector created by quantize_face_detector, it runs on the CPU."""
+    _check_quantization()
+    if get_device().type != 'cpu':
+        raise ValueError("The INT8 face detector only runs on the CPU, choose --device cpu.")
+    path = quantized_path(backbone_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} does not exist. Create it with: python deepfake_detector/profiling.py --task quantize --data_path your_path/videos")
+    extra_files = {'source': ''}
+    net = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+    if extra_files['source'].decode() != _export_source(backbone_path):
+        print(f"{path} was created from other weights or another pytorch version, calibrate it again.")
+    torch.set_grad_enabled(False)
+    return net, detector_configs()[0 if backbone == 'mobile0.25' else 1]
+
+
+def compare_detectors(reference, net, sizes=EXPORT_CHECK_SIZES):
+    """Largest absolute difference of the box, score and landmark outputs of two face detectors."""
+    difference = 0.0
+    generator = torch.Generator().manual_seed(0)
+    with torch.no_grad():
+        for size in sizes:
+            inputs = torch.randn(size, generator=generator) * 50
+            for expected, output in zip(reference(inputs), net(inputs)):
+                difference = max(difference, (expected - output).abs().max().item())
+    return difference
@@ -1,8 +1,14 @@
+import threading
 import torch
-from itertools import product as product
+from collections import OrderedDict
 import numpy as np
 from math import ceil
 
+# number of anchor sets that are kept by cached_priors
+PRIOR_CACHE_SIZE = 8
+_prior_cache = OrderedDict()
+_prior_lock = threading.Lock()
+
 
 class PriorBox(object):
     def __init__(self, cfg, image_size=None, phase='train'):
@@ -17,18 +23,39 @@ class PriorBox(object):
     def forward(self):
         anchors = []
         for k, f in enumerate(self.feature_maps):
-            min_sizes = self.min_sizes[k]
-            for i, j in product(range(f[0]), range(f[1])):
-                for min_size in min_sizes:
-                    s_kx = min_size / self.image_size[1]
-                    s_ky = min_size / self.image_size[0]
-                    dense_cx = [x * self.steps[k] / self.image_size[1] for x in [j + 0.5]]
-                    dense_cy = [y * self.steps[k] / self.image_size[0] for y in [i + 0.5]]
-                    for cy, cx in product(dense_cy, dense_cx):
-                        anchors += [cx, cy, s_kx, s_ky]
+            min_sizes = np.array(self.min_sizes[k], dtype=np.float64)
+            # anchor centers of all feature map cells, row by row
+            cx = (np.arange(f[1]) + 0.5) * self.steps[k] / self.image_size[1]
+            cy = (np.arange(f[0]) + 0.5) * self.steps[k] / self.image_size[0]
+            level = np.empty((f[0], f[1], len(min_sizes), 4))
+            level[..., 0] = cx[None, :, None]
+            level[..., 1] = cy[:, None, None]
+            level[..., 2] = min_sizes / self.image_size[1]
+            level[..., 3] = min_sizes / self.image_size[0]
+            anchors.append(level.reshape(-1, 4))
 
         # back to torch land
-        output = torch.Tensor(anchors).view(-1, 4)
+        output = torch.from_numpy(np.concatenate(anchors).astype(np.float32))
         if self.clip:
             output.clamp_(max=1, min=0)
         return output
+
+
+def cached_priors(cfg, image_size, device='cpu'):
+    """
+    Anchors of an image size on a device, generated once and kept for the
+    last PRIOR_CACHE_SIZE combinations of config and image size.
+    The returned tensor is shared and must not be changed.
+    """
+    key = (cfg['name'], tuple(cfg['steps']), tuple(image_size), str(device))
+    with _prior_lock:
+        priors = _prior_cache.get(key)
+        if priors is not None:
+            _prior_cache.move_to_end(key)
+            return priors
+    priors = PriorBox(cfg, image_size=image_size).forward().to(device)
+    with _prior_lock:
+        _prior_cache[key] = priors
+        if len(_prior_cache) > PRIOR_CACHE_SIZE:
+            _prior_cache.popitem(last=False)
+    return priors
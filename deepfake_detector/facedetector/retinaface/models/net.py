@@ -66,8 +66,10 @@ class SSH(nn.Module):
         return out
 
 class FPN(nn.Module):
-    def __init__(self,in_channels_list,out_channels):
+    def __init__(self,in_channels_list,out_channels,levels=(0, 1, 2)):
         super(FPN,self).__init__()
+        # outputs of the levels that are not in levels are not computed and None
+        self.levels = tuple(levels)
         leaky = 0
         if (out_channels <= 64):
             leaky = 0.1
@@ -82,17 +84,20 @@ class FPN(nn.Module):
         # names = list(input.keys())
         input = list(input.values())
 
-        output1 = self.output1(input[0])
-        output2 = self.output2(input[1])
+        output1 = output2 = None
         output3 = self.output3(input[2])
 
-        up3 = F.interpolate(output3, size=[output2.size(2), output2.size(3)], mode="nearest")
-        output2 = output2 + up3
-        output2 = self.merge2(output2)
-
-        up2 = F.interpolate(output2, size=[output1.size(2), output1.size(3)], mode="nearest")
-        output1 = output1 + up2
-        output1 = self.merge1(output1)
+        if min(self.levels) <= 1:
+            output2 = self.output2(input[1])
+            up3 = F.interpolate(output3, size=[output2.size(2), output2.size(3)], mode="nearest")
+            output2 = output2 + up3
+            output2 = self.merge2(output2)
+
+        if min(self.levels) == 0:
+            output1 = self.output1(input[0])
+            up2 = F.interpolate(output2, size=[output1.size(2), output1.size(3)], mode="nearest")
+            output1 = output1 + up2
+            output1 = self.merge1(output1)
 
         out = [output1, output2, output3]
         return out
@@ -50,9 +50,14 @@ class RetinaFace(nn.Module):
         """
         :param cfg:  Network related settings.
         :param phase: train or test.
+        cfg['levels'] (optional): FPN levels whose heads are evaluated, their anchors
+                                  are the ones that PriorBox generates for cfg['steps'].
+        cfg['landmarks'] (optional): False only returns boxes and scores.
         """
         super(RetinaFace,self).__init__()
         self.phase = phase
+        self.levels = list(cfg.get('levels', [0, 1, 2]))
+        self.landmarks = cfg.get('landmarks', True)
         backbone = None
         if cfg['name'] == 'mobilenet0.25':
             backbone = MobileNetV1()
@@ -77,14 +82,15 @@ class RetinaFace(nn.Module):
             in_channels_stage2 * 8,
         ]
         out_channels = cfg['out_channel']
-        self.fpn = FPN(in_channels_list,out_channels)
+        self.fpn = FPN(in_channels_list,out_channels,self.levels)
         self.ssh1 = SSH(out_channels, out_channels)
         self.ssh2 = SSH(out_channels, out_channels)
         self.ssh3 = SSH(out_channels, out_channels)
 
         self.ClassHead = self._make_class_head(fpn_num=3, inchannels=cfg['out_channel'])
         self.BboxHead = self._make_bbox_head(fpn_num=3, inchannels=cfg['out_channel'])
-        self.LandmarkHead = self._make_landmark_head(fpn_num=3, inchannels=cfg['out_channel'])
+        if self.landmarks:
+            self.LandmarkHead = self._make_landmark_head(fpn_num=3, inchannels=cfg['out_channel'])
 
     def _make_class_head(self,fpn_num=3,inchannels=64,anchor_num=2):
         classhead = nn.ModuleList()
@@ -111,17 +117,16 @@ class RetinaFace(nn.Module):
         fpn = self.fpn(out)
 
         # SSH
-        feature1 = self.ssh1(fpn[0])
-        feature2 = self.ssh2(fpn[1])
-        feature3 = self.ssh3(fpn[2])
-        features = [feature1, feature2, feature3]
-
-        bbox_regressions = torch.cat([self.BboxHead[i](feature) for i, feature in enumerate(features)], dim=1)
-        classifications = torch.cat([self.ClassHead[i](feature) for i, feature in enumerate(features)],dim=1)
-        ldm_regressions = torch.cat([self.LandmarkHead[i](feature) for i, feature in enumerate(features)], dim=1)
-
-        if self.phase == 'train':
-            output = (bbox_regressions, classifications, ldm_regressions)
-        else:
-            output = (bbox_regressions, F.softmax(classifications, dim=-1), ldm_regressions)
-        return output
\ No newline at end of file
+        ssh = [self.ssh1, self.ssh2, self.ssh3]
+        features = [(i, ssh[i](fpn[i])) for i in self.levels]
+
+        bbox_regressions = torch.cat([self.BboxHead[i](feature) for i, feature in features], dim=1)
+        classifications = torch.cat([self.ClassHead[i](feature) for i, feature in features],dim=1)
+        if self.phase != 'train':
+            classifications = F.softmax(classifications, dim=-1)
+        if not self.landmarks:
+            return bbox_regressions, classifications
+        ldm_regressions = torch.cat([self.LandmarkHead[i](feature) for i, feature in features], dim=1)
+
+        output = (bbox_regressions, classifications, ldm_regressions)
+        return output
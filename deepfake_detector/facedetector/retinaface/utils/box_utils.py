@@ -264,6 +264,7 @@ def log_sum_exp(x):
 def nms(boxes, scores, overlap=0.5, top_k=200):
     """Apply non-maximum suppression at test time to avoid detecting too many
     overlapping bounding boxes for a given object.
+    The overlaps of the top_k boxes are computed at once as IoU matrix.
     Args:
         boxes: (tensor) The location preds for the img, Shape: [num_priors,4].
         scores: (tensor) The class predscores for the img, Shape:[num_priors].
@@ -276,55 +277,73 @@ def nms(boxes, scores, overlap=0.5, top_k=200):
     keep = torch.Tensor(scores.size(0)).fill_(0).long()
     if boxes.numel() == 0:
         return keep
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
-    area = torch.mul(x2 - x1, y2 - y1)
     v, idx = scores.sort(0)  # sort in ascending order
     # I = I[v >= 0.01]
-    idx = idx[-top_k:]  # indices of the top-k largest vals
-    xx1 = boxes.new()
-    yy1 = boxes.new()
-    xx2 = boxes.new()
-    yy2 = boxes.new()
-    w = boxes.new()
-    h = boxes.new()
-
-    # keep = torch.Tensor()
-    count = 0
-    while idx.numel() > 0:
-        i = idx[-1]  # index of current largest val
-        # keep.append(i)
-        keep[count] = i
-        count += 1
-        if idx.size(0) == 1:
-            break
-        idx = idx[:-1]  # remove kept element from view
-        # load bboxes of next highest vals
-        torch.index_select(x1, 0, idx, out=xx1)
-        torch.index_select(y1, 0, idx, out=yy1)
-        torch.index_select(x2, 0, idx, out=xx2)
-        torch.index_select(y2, 0, idx, out=yy2)
-        # store element-wise max with next highest score
-        xx1 = torch.clamp(xx1, min=x1[i])
-        yy1 = torch.clamp(yy1, min=y1[i])
-        xx2 = torch.clamp(xx2, max=x2[i])
-        yy2 = torch.clamp(yy2, max=y2[i])
-        w.resize_as_(xx2)
-        h.resize_as_(yy2)
-        w = xx2 - xx1
-        h = yy2 - yy1
-        # check sizes of xx1 and xx2.. after each iteration
-        w = torch.clamp(w, min=0.0)
-        h = torch.clamp(h, min=0.0)
-        inter = w*h
-        # IoU = i / (area(a) + area(b) - i)
-        rem_areas = torch.index_select(area, 0, idx)  # load remaining areas)
-        union = (rem_areas - inter) + area[i]
-        IoU = inter/union  # store result in iou
-        # keep only elements with an IoU <= overlap
-        idx = idx[IoU.le(overlap)]
+    idx = idx[-top_k:].flip(0)  # indices of the top-k largest vals, largest first
+    kept = idx[greedy_nms(boxes[idx], overlap)]
+    count = kept.size(0)
+    keep[:count] = kept.to(keep.device)
     return keep, count
 
 
+def batched_nms(boxes, scores, image_ids, overlap=0.5):
+    """Apply non-maximum suppression to the boxes of several images at once.
+    Boxes only suppress boxes of the same image.
+    Args:
+        boxes: (tensor) The location preds of all images, Shape: [num_boxes,4].
+        scores: (tensor) The class predscores, Shape:[num_boxes].
+        image_ids: (tensor) The index of the image of each box, Shape:[num_boxes].
+        overlap: (float) The overlap thresh for suppressing unnecessary boxes.
+    Return:
+        The indices of the kept boxes ordered by decreasing score.
+    """
+    if boxes.numel() == 0:
+        return torch.zeros(0, dtype=torch.long, device=boxes.device)
+    idx = scores.sort(0, descending=True)[1]
+    return idx[greedy_nms(boxes[idx], overlap, image_ids[idx])]
+
+
+# number of top scoring remaining boxes that are compared to each other at once
+NMS_BLOCK_SIZE = 16
+
+
+def greedy_nms(boxes, overlap, groups=None):
+    """Positions of the boxes kept by greedy NMS of boxes sorted by decreasing score.
+    Blocks of the top remaining boxes are resolved with an IoU matrix and the overlaps
+    of all boxes kept in a block are removed at once.
+    Args:
+        boxes: (tensor) Boxes sorted by score, Shape: [num_boxes,4].
+        overlap: (float) The overlap thresh for suppressing unnecessary boxes.
+        groups: (tensor) Optional group of each box, boxes only suppress boxes of their group.
+    """
+    x1, y1, x2, y2 = boxes.unbind(1)
+    area = torch.mul(x2 - x1, y2 - y1)
+
+    def below(rows, cols):
+        # IoU = i / (area(a) + area(b) - i), row boxes are the kept ones
+        w = torch.clamp(torch.min(x2[cols], x2[rows].unsqueeze(1)) - torch.max(x1[cols], x1[rows].unsqueeze(1)), min=0.0)
+        h = torch.clamp(torch.min(y2[cols], y2[rows].unsqueeze(1)) - torch.max(y1[cols], y1[rows].unsqueeze(1)), min=0.0)
+        inter = w*h
+        union = (area[cols] - inter) + area[rows].unsqueeze(1)
+        result = (inter/union).le(overlap)
+        if groups is not None:
+            result |= groups[rows].unsqueeze(1) != groups[cols]
+        return result
+
+    remaining = torch.arange(boxes.size(0), device=boxes.device)
+    kept = []
+    while remaining.numel() > 0:
+        block = remaining[:NMS_BLOCK_SIZE]
+        removed = (~below(block, block)).cpu().numpy()
+        suppressed = np.zeros(block.numel(), dtype=bool)
+        rows = []
+        for row in range(block.numel()):
+            if not suppressed[row]:
+                rows.append(row)
+                suppressed[row + 1:] |= removed[row, row + 1:]
+        block = block[rows]
+        kept.append(block)
+        remaining = remaining[NMS_BLOCK_SIZE:]
+        if remaining.numel() > 0:
+            remaining = remaining[below(block, remaining).all(0)]
+    return torch.cat(kept)
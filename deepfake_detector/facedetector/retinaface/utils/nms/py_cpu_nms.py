@@ -7,32 +7,53 @@
 
 import numpy as np
 
+# number of top scoring remaining boxes that are compared to each other at once
+NMS_BLOCK_SIZE = 16
+
+
 def py_cpu_nms(dets, thresh):
-    """Pure Python NMS baseline."""
-    x1 = dets[:, 0]
-    y1 = dets[:, 1]
-    x2 = dets[:, 2]
-    y2 = dets[:, 3]
+    """
+    Greedy NMS that resolves blocks of the top scoring remaining boxes with an IoU matrix
+    and removes the overlaps of all boxes kept in a block at once.
+    Keeps the same boxes in the same order as the former loop over single boxes.
+    """
     scores = dets[:, 4]
+    order = scores.argsort()[::-1]
+    x1 = dets[order, 0]
+    y1 = dets[order, 1]
+    x2 = dets[order, 2]
+    y2 = dets[order, 3]
 
     areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
 
-    keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
+    def overlap(rows, cols):
+        xx1 = np.maximum(x1[rows, None], x1[cols])
+        yy1 = np.maximum(y1[rows, None], y1[cols])
+        xx2 = np.minimum(x2[rows, None], x2[cols])
+        yy2 = np.minimum(y2[rows, None], y2[cols])
 
         w = np.maximum(0.0, xx2 - xx1 + 1)
         h = np.maximum(0.0, yy2 - yy1 + 1)
         inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        return inter / (areas[rows, None] + areas[cols] - inter)
 
-        inds = np.where(ovr <= thresh)[0]
-        order = order[inds + 1]
+    # positions in score order of the boxes that are neither kept nor removed yet
+    remaining = np.arange(order.size)
+    keep = []
+    while remaining.size > 0:
+        block = remaining[:NMS_BLOCK_SIZE]
+        # boxes are removed unless their overlap is at most thresh
+        removed = ~(overlap(block, block) <= thresh)
+        suppressed = np.zeros(block.size, dtype=bool)
+        kept = []
+        for row in range(block.size):
+            if not suppressed[row]:
+                kept.append(row)
+                suppressed[row + 1:] |= removed[row, row + 1:]
+        kept = block[kept]
+        keep.extend(order[kept])
+        remaining = remaining[block.size:]
+        if remaining.size > 0:
+            remaining = remaining[(overlap(kept, remaining) <= thresh).all(axis=0)]
 
     return keep
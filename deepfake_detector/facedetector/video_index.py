@@ -0,0 +1,79 @@
+import os
+from multiprocessing.pool import ThreadPool
+
+import cv2
+import pandas as pd
+from tqdm import tqdm
+
+
+def probe_video(video):
+    """Read frame count, fps, resolution and duration from the video header."""
+    cap = cv2.VideoCapture(video)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    stat = os.stat(video)
+    return {'video': video, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+            'frame_count': frame_count, 'fps': fps, 'width': width, 'height': height,
+            'duration': frame_count / fps if fps > 0 else 0.0}
+
+
+class VideoIndex():
+    """
+    Frame count, fps, resolution and duration of the videos of a dataset.
+    The index is stored as csv and entries are probed again when a video's size or modification time changes.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.records = {}
+        if os.path.exists(index_path):
+            for record in pd.read_csv(index_path).to_dict('records'):
+                self.records[record['video']] = record
+
+    def build(self, videos, workers=8):
+        """Probe all videos that are missing or outdated in parallel and save the index."""
+        missing = [video for video in videos if self.get(video) is None]
+        if missing:
+            print(f"Indexing {len(missing)} videos.")
+            # opening a video releases the GIL, so threads probe in parallel
+            with ThreadPool(workers) as pool:
+                for record in tqdm(pool.imap_unordered(probe_video, missing), total=len(missing)):
+                    self.records[record['video']] = record
+            self.save()
+        return self
+
+    def save(self):
+        pd.DataFrame(list(self.records.values())).to_csv(
+            self.index_path, index=False)
+
+    def get(self, video):
+        """Metadata of a video or None if it is not indexed or changed since."""
+        record = self.records.get(video)
+        if record is None:
+            return None
+        try:
+            stat = os.stat(video)
+        except FileNotFoundError:
+            return None
+        if record['size'] != stat.st_size or record['mtime'] != stat.st_mtime_ns:
+            return None
+        return record
+
+    def frame_count(self, video):
+        record = self.get(video)
+        return None if record is None else int(record['frame_count'])
+
+    def cost(self, video):
+        """Decoded pixels of a video, which is proportional to the time it takes to process it."""
+        record = self.get(video)
+        if record is None:
+            return 0
+        return record['width'] * record['height'] * record['frame_count']
+
+    def schedule(self, videos):
+        """Positions of the videos ordered from the most to the least expensive video."""
+        costs = [self.cost(video) for video in videos]
+        return sorted(range(len(videos)), key=lambda pos: -costs[pos])
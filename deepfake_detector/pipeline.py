@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+
+import numpy as np
+from tqdm import tqdm
+
+# marks the end of the items in a stage queue
+_STOP = object()
+
+
+class Stage():
+    """A step of the pipeline that applies func to each item with its own worker threads."""
+
+    def __init__(self, name, func, workers=1):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker.")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        # summed time that the workers spent in func
+        self.busy_time = 0.0
+
+
+class Pipeline():
+    """
+    Streams items through stages that are connected by bounded queues.
+    All stages work at the same time and a full queue blocks the stage in front of it (backpressure).
+    The occupancy of each stage's input queue is sampled while running to find the bottleneck stage.
+    Items for which a stage returns None skip the following stages.
+    """
+
+    def __init__(self, stages, queue_size=4, sample_interval=0.05):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.sample_interval = sample_interval
+        # queue i is the input of stage i, the last queue holds the results
+        self.queues = [queue.Queue(maxsize=queue_size)
+                       for _ in range(len(stages) + 1)]
+        self.occupancy = {stage.name: [] for stage in stages}
+        self._lock = threading.Lock()
+        self._error = None
+
+    def run(self, items):
+        """Run all items through the pipeline and return the results in input order."""
+        finished = [0] * len(self.stages)
+        threads = []
+        for stage_idx, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage_idx, finished), daemon=True))
+        threads.append(threading.Thread(
+            target=self._feed, args=(items,), daemon=True))
+        done = threading.Event()
+        threads.append(threading.Thread(
+            target=self._monitor, args=(done,), daemon=True))
+        for thread in threads:
+            thread.start()
+        results = [None] * len(items)
+        with tqdm(total=len(items)) as progress:
+            while True:
+                item = self.queues[-1].get()
+                if item is _STOP:
+                    break
+                idx, payload = item
+                results[idx] = payload
+                progress.update(1)
+        done.set()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return results
+
+    def stats(self):
+        """Mean and maximum input queue occupancy, fraction of time full and busy time per stage."""
+        stats = {}
+        for stage in self.stages:
+            sizes = np.array(self.occupancy[stage.name] or [0])
+            stats[stage.name] = {'workers': stage.workers,
+                                 'mean_queue': float(np.mean(sizes)),
+                                 'max_queue': int(np.max(sizes)),
+                                 'full': float(np.mean(sizes >= self.queue_size)),
+                                 'busy_time': stage.busy_time}
+        return stats
+
+    def report(self):
+        """Print the queue occupancy of each stage."""
+        print("Pipeline stage occupancy:")
+        for name, stage in self.stats().items():
+            print(f"{name}: {stage['workers']} worker(s), input queue {stage['mean_queue']:.1f}/{self.queue_size} on average "
+                  f"(max {stage['max_queue']}), full {stage['full'] * 100:.0f}% of the time, busy {stage['busy_time']:.1f} s.")
+        print("The bottleneck is the last stage whose input queue is mostly full, the stages in front of it wait because of backpressure.")
+
+    def _feed(self, items):
+        for idx, item in enumerate(items):
+            # blocks while the first stage is busy
+            self.queues[0].put((idx, item))
+        self.queues[0].put(_STOP)
+
+    def _work(self, stage_idx, finished):
+        stage = self.stages[stage_idx]
+        in_queue = self.queues[stage_idx]
+        out_queue = self.queues[stage_idx + 1]
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                # let the other workers of the stage see the stop as well
+                in_queue.put(_STOP)
+                with self._lock:
+                    finished[stage_idx] += 1
+                    last = finished[stage_idx] == stage.workers
+                # the last worker passes the stop on after all items were passed on
+                if last:
+                    out_queue.put(_STOP)
+                return
+            idx, payload = item
+            if payload is not None and self._error is None:
+                start = time.time()
+                try:
+                    payload = stage.func(payload)
+                except Exception as e:
+                    # stop processing and raise the error in run()
+                    self._error = e
+                    payload = None
+                with self._lock:
+                    stage.busy_time += time.time() - start
+            out_queue.put((idx, payload))
+
+    def _monitor(self, done):
+        while not done.wait(self.sample_interval):
+            for stage_idx, stage in enumerate(self.stages):
+                self.occupancy[stage.name].append(
+                    self.queues[stage_idx].qsize())
@@ -0,0 +1,690 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+from math import ceil
+
+import numpy as np
+import pandas as pd
+import test
+import torch
+from dfdetector import DFDetector, parse_det_scale
+from facedetector.buffer_pool import BufferPool
+from facedetector.detection_store import DetectionStore
+from facedetector.retinaface import df_retinaface
+from facedetector.retinaface.data import cfg_re50
+from facedetector.retinaface.layers.functions.prior_box import PriorBox, cached_priors
+from facedetector.retinaface.utils.box_utils import batched_nms, matrix_iou, nms
+from facedetector.retinaface.utils.nms.py_cpu_nms import py_cpu_nms
+
+
+parser = argparse.ArgumentParser(
+    description='Measure the speed of the deepfake detection pipeline.')
+parser.add_argument('--task', default="decode", type=str,
+                    help='Choose the measurement: decode, det_scale, early_exit, memory, detect_batch, priorbox, nms, precision, torchscript, quantize, deploy, roi, inputs, store or detector.')
+parser.add_argument('--data_path', default=None, type=str,
+                    help='Specify path to a folder with videos.')
+parser.add_argument('--num_frames', default=20, type=int,
+                    help='Choose the number of frames sampled per video.')
+parser.add_argument('--max_videos', default=50, type=int,
+                    help='Choose the maximum number of videos per video format.')
+parser.add_argument('--det_scales', default="0.75,0.5,auto", type=str,
+                    help='Choose the detection scales that are compared to full resolution.')
+parser.add_argument('--batch_sizes', default="1,4,10,20", type=str,
+                    help='Choose the face detection batch sizes that are compared.')
+parser.add_argument('--dataset', default="uadfv", type=str,
+                    help='Specify the name of the dataset for benchmark measurements (comma-separated for detector).')
+parser.add_argument('--detection_method', default="xception_uadfv", type=str,
+                    help='Choose the detection method for benchmark measurements (comma-separated for detector).')
+parser.add_argument('--thresholds', default="none,0.95,0.9,0.8", type=str,
+                    help='Choose the early exit thresholds, none classifies all frames.')
+parser.add_argument('--min_frames', default=3, type=int,
+                    help='Choose the number of frames that are classified at least with early exit.')
+parser.add_argument('--det_levels', default="1,2", type=str,
+                    help='Choose the FPN levels of the deployment variant of the face detector that is compared.')
+parser.add_argument('--roi', default=1.0, type=float,
+                    help='Choose the margin of the regions around the previous face that are compared to whole frames.')
+parser.add_argument('--img_size', default=299, type=int,
+                    help='Choose the classifier input size of the inputs measurement.')
+parser.add_argument('--normalization', default="xception", type=str,
+                    help='Choose the classifier input normalization of the inputs measurement: xception or imagenet.')
+parser.add_argument('--precision', default="bf16", type=str,
+                    help='Choose the reduced precision that is compared to fp32: bf16 or fp16.')
+
+
+def collect_videos(data_path, max_videos=50):
+    """Collect up to max_videos .avi and .mp4 videos from a folder, grouped by format."""
+    if data_path is None:
+        raise ValueError("Please specify a path to a folder with videos.")
+    videos = {'.avi': [], '.mp4': []}
+    for path, _, files in os.walk(data_path):
+        for f in sorted(files):
+            ext = os.path.splitext(f)[1].lower()
+            if ext in videos and len(videos[ext]) < max_videos:
+                videos[ext].append(os.path.join(path, f))
+    return {ext: vids for ext, vids in videos.items() if vids}
+
+
+def decode_benchmark(data_path, num_frames=20, max_videos=50):
+    """
+    Compare the decode time per video of grab and seek sampling
+    for AVI (DF-TIMIT) and MP4 (UADFV, Celeb-DF, DFDC) videos.
+    """
+    videos = collect_videos(data_path, max_videos)
+    modes = ['grab', 'seek']
+    for ext, vids in videos.items():
+        times = {mode: [] for mode in modes}
+        mismatches = 0
+        for video in vids:
+            frames = {}
+            for mode in modes:
+                start = time.time()
+                frames[mode] = df_retinaface.read_frames(
+                    video, num_frames, sampling=mode)
+                times[mode].append(time.time() - start)
+            # both modes must return the same frames
+            if len(frames['grab']) != len(frames['seek']) or not all(
+                    np.array_equal(a, b) for a, b in zip(frames['grab'], frames['seek'])):
+                mismatches += 1
+        grab_time = np.mean(times['grab'])
+        seek_time = np.mean(times['seek'])
+        print(f"{ext} ({len(vids)} videos, {num_frames} frames per video):")
+        print(f"grab: {grab_time * 1000:.1f} ms per video")
+        print(f"seek: {seek_time * 1000:.1f} ms per video")
+        print(f"Speedup: {grab_time / seek_time:.2f}x")
+        print(f"Videos with different frames: {mismatches}")
+        print()
+
+
+def detection_scale_benchmark(data_path, scales, num_frames=20, max_videos=50):
+    """
+    Compare face detection on downscaled frames to full-resolution detection
+    by speedup and IoU of the detected face boxes.
+    """
+    net, cfg = df_retinaface.load_face_detector()
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    times = {scale: [] for scale in [1.0] + scales}
+    ious = {scale: [] for scale in scales}
+    missed = {scale: 0 for scale in scales}
+    for video in videos:
+        for frame in df_retinaface.read_frames(video, num_frames):
+            dets = {}
+            for scale in [1.0] + scales:
+                start = time.time()
+                _, dets[scale] = df_retinaface.detect_face_from_frame(
+                    frame, net, cfg, det_scale=scale)
+                times[scale].append(time.time() - start)
+            # compare the top face box to the full resolution box
+            if len(dets[1.0]) == 0:
+                continue
+            for scale in scales:
+                if len(dets[scale]) == 0:
+                    missed[scale] += 1
+                    continue
+                ious[scale].append(
+                    matrix_iou(dets[1.0][:1, :4], dets[scale][:1, :4])[0, 0])
+    full_time = np.mean(times[1.0])
+    print(f"Full resolution: {full_time * 1000:.1f} ms per frame")
+    for scale in scales:
+        print(f"Scale {scale}: {np.mean(times[scale]) * 1000:.1f} ms per frame, "
+              f"speedup {full_time / np.mean(times[scale]):.2f}x, "
+              f"mean box IoU {np.mean(ious[scale]) if ious[scale] else float('nan'):.3f}, "
+              f"missed faces {missed[scale]}")
+
+
+def early_exit_benchmark(dataset, data_path, method, thresholds, min_frames=3):
+    """
+    Benchmark a frame-level method with different early exit thresholds
+    and compare AUC, throughput and the number of frames used per video.
+    """
+    results = []
+    for threshold in thresholds:
+        start = time.time()
+        auc, _, _, _ = DFDetector.benchmark(
+            dataset=dataset, data_path=data_path, method=method, early_exit=threshold, min_frames=min_frames)
+        duration = time.time() - start
+        predictions = pd.read_csv(f'{method}_predictions_on_{dataset}.csv')
+        frames = predictions['Frames'].mean(
+        ) if 'Frames' in predictions else float('nan')
+        results.append((threshold, auc, len(predictions) / duration, frames))
+    print("Threshold | AUC | Videos per second | Frames per video")
+    for threshold, auc, throughput, frames in results:
+        print(f"{threshold} | {auc:.5f} | {throughput:.2f} | {frames:.2f}")
+
+
+def detect_batch_benchmark(data_path, batch_sizes, num_frames=20, max_videos=50):
+    """
+    Compare face detection time per frame for several batch sizes
+    and check that the face boxes match detection frame by frame.
+    """
+    net, cfg = df_retinaface.load_face_detector()
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    times = {batch_size: [] for batch_size in batch_sizes}
+    max_diff = {batch_size: 0.0 for batch_size in batch_sizes}
+    for video in videos:
+        frames = df_retinaface.read_frames(video, num_frames)
+        if not frames:
+            continue
+        reference = df_retinaface.detect_frames(frames, net, cfg, batch_size=1)
+        for batch_size in batch_sizes:
+            start = time.time()
+            faces = df_retinaface.detect_frames(
+                frames, net, cfg, batch_size=batch_size)
+            times[batch_size].append((time.time() - start) / len(frames))
+            for face, ref in zip(faces, reference):
+                if face[1].shape != ref[1].shape:
+                    max_diff[batch_size] = float('inf')
+                elif face[1].size > 0:
+                    max_diff[batch_size] = max(
+                        max_diff[batch_size], float(np.abs(face[1] - ref[1]).max()))
+    single_time = np.mean(times[batch_sizes[0]])
+    for batch_size in batch_sizes:
+        print(f"Batch size {batch_size}: {np.mean(times[batch_size]) * 1000:.1f} ms per frame, "
+              f"speedup {single_time / np.mean(times[batch_size]):.2f}x, "
+              f"max difference to frame by frame {max_diff[batch_size]:.4f}")
+
+
+def detector_benchmark(datasets, detectors, num_frames=20, max_videos=50):
+    """
+    Compare face detector tiers by detection time per frame and
+    by the video-level AUC of a detection method on each dataset.
+    # Arguments:
+        datasets: (dataset, data path, detection method) triples.
+        detectors: Face detector tiers, the first one is the reference.
+    """
+    for dataset, data_path, method in datasets:
+        videos = [video for vids in collect_videos(
+            data_path, max_videos).values() for video in vids]
+        frames = [df_retinaface.read_frames(
+            video, num_frames) for video in videos]
+        results = {}
+        for detector in detectors:
+            net, cfg = df_retinaface.load_face_detector(backbone=detector)
+            start = time.time()
+            for video_frames in frames:
+                df_retinaface.detect_frames(video_frames, net, cfg)
+            latency = (time.time() - start) / max(1, sum(len(f) for f in frames))
+            auc, _, _, _ = DFDetector.benchmark(
+                dataset=dataset, data_path=data_path, method=method, detector=detector)
+            results[detector] = (latency, auc)
+        reference_latency, reference_auc = results[detectors[0]]
+        print(f"{dataset} with {method}:")
+        for detector, (latency, auc) in results.items():
+            print(f"{detector}: {latency * 1000:.1f} ms per frame, speedup {reference_latency / latency:.2f}x, "
+                  f"AUC {auc:.5f} ({auc - reference_auc:+.5f})")
+        print()
+
+
+def precision_benchmark(dataset, data_path, methods, precision):
+    """
+    Benchmark detection methods in fp32 and reduced precision and compare
+    the prediction drift per video, the AUC and the throughput.
+    """
+    for method in methods:
+        results = {}
+        for mode in [None, precision]:
+            df_retinaface.configure(precision=mode)
+            start = time.time()
+            auc, _, _, _ = DFDetector.benchmark(
+                dataset=dataset, data_path=data_path, method=method)
+            duration = time.time() - start
+            predictions = pd.read_csv(f'{method}_predictions_on_{dataset}.csv')
+            results[mode] = (auc, len(predictions) / duration, predictions)
+        df_retinaface.configure(precision=None)
+        auc, throughput, predictions = results[None]
+        reduced_auc, reduced_throughput, reduced_predictions = results[precision]
+        merged = predictions.merge(reduced_predictions, on='Video', suffixes=('', '_reduced'))
+        drift = (merged['Prediction'] - merged['Prediction_reduced']).abs()
+        changed = (merged['Prediction'].round() != merged['Prediction_reduced'].round()).sum()
+        print(f"{method} on {dataset}, fp32 vs {precision}:")
+        print(f"Prediction drift: mean {drift.mean():.5f}, max {drift.max():.5f}, "
+              f"{changed} of {len(merged)} videos change their label")
+        print(f"AUC: {auc:.5f} vs {reduced_auc:.5f} ({reduced_auc - auc:+.5f})")
+        print(f"Videos per second: {throughput:.2f} vs {reduced_throughput:.2f}, "
+              f"speedup {reduced_throughput / throughput:.2f}x")
+        print()
+
+
+def torchscript_benchmark(detectors, sizes=((480, 640), (720, 1280)), repeats=10):
+    """Compare loading time, forward latency and outputs of the eager and the TorchScript face detector."""
+    device = df_retinaface.get_device()
+    for detector in detectors:
+        backbone_path = df_retinaface.DETECTOR_DIR + df_retinaface.DETECTOR_WEIGHTS[detector]
+        # the export is created before timing
+        df_retinaface.load_scripted_detector(detector, backbone_path, device)
+        nets, load_times = {}, {}
+        for name, scripted in [('eager', False), ('torchscript', True)]:
+            df_retinaface.configure(torchscript=scripted)
+            start = time.time()
+            nets[name], _ = df_retinaface.load_face_detector(backbone=detector)
+            load_times[name] = time.time() - start
+        df_retinaface.configure(torchscript=False)
+        print(f"{detector}: loading takes {load_times['eager']:.2f} s eager and {load_times['torchscript']:.2f} s from TorchScript")
+        print(f"Largest output difference: {df_retinaface.compare_detectors(nets['eager'].cpu(), nets['torchscript'].cpu()):.2e}")
+        for height, width in sizes:
+            inputs = torch.randn(1, 3, height, width).to(device)
+            latencies = {}
+            for name, net in nets.items():
+                net.to(device)
+                net(inputs)
+                start = time.time()
+                for _ in range(repeats):
+                    net(inputs)
+                latencies[name] = (time.time() - start) / repeats
+            print(f"{width}x{height}: {latencies['eager'] * 1000:.1f} ms eager, "
+                  f"{latencies['torchscript'] * 1000:.1f} ms TorchScript, speedup {latencies['eager'] / latencies['torchscript']:.2f}x")
+        print()
+
+
+def quantize_benchmark(data_path, num_frames=20, max_videos=50, iou_threshold=0.5):
+    """
+    Calibrate the INT8 face detector on half of the videos and compare it to the fp32
+    face detector on the other half by box IoU, recall of the fp32 faces and latency per frame.
+    """
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    calibration, evaluation = videos[::2], videos[1::2] or videos
+    df_retinaface.configure(device='cpu')
+    print(f"Calibrating the INT8 face detector on {len(calibration)} videos.")
+    df_retinaface.quantize_face_detector(calibration, num_frames)
+    frames = [df_retinaface.read_frames(video, num_frames) for video in evaluation]
+    compare_face_detectors(frames, [('fp32', {'int8': False}), ('int8', {'int8': True})], iou_threshold)
+
+
+def deploy_benchmark(data_path, det_levels, num_frames=20, max_videos=50, iou_threshold=0.5, face_margin=0.3):
+    """
+    Compare the deployment variants of the face detector without landmarks, with all
+    and with only the det_levels FPN levels, to the full face detector.
+    """
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    frames = [df_retinaface.read_frames(video, num_frames) for video in videos]
+    levels_name = ','.join(str(level) for level in det_levels)
+    variants = [('full', {'deploy': False, 'det_levels': None}),
+                ('deploy', {'deploy': True, 'det_levels': None}),
+                (f'deploy {levels_name}', {'deploy': True, 'det_levels': det_levels})]
+    compare_face_detectors(frames, variants, iou_threshold)
+    # the faces of the deployment variants have no landmarks, they are cropped like the others
+    for name, variant in variants:
+        crops, mismatches = 0, 0
+        with df_retinaface.configured(**variant):
+            net, cfg = df_retinaface.load_face_detector()
+            for video, video_frames in zip(videos, frames):
+                faces = df_retinaface.detect_frames(video_frames, net, cfg)
+                video_crops = df_retinaface.face_crops(faces, video, face_margin)
+                retained = df_retinaface.face_crops(
+                    df_retinaface.retain_face_crops(faces, face_margin), video, face_margin)
+                crops += sum(crop.size > 0 for crop in video_crops)
+                mismatches += sum(not np.array_equal(a, b) for a, b in zip(video_crops, retained))
+        print(f"{name}: {crops} face crops with face margin {face_margin}, "
+              f"{mismatches} differ with retained crops")
+
+
+def roi_benchmark(data_path, margin, num_frames=20, max_videos=50, iou_threshold=0.5):
+    """
+    Compare face detection in regions around the previous face to detection in whole frames.
+    """
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    frames = [df_retinaface.read_frames(video, num_frames) for video in videos]
+    compare_face_detectors(frames, [('frame', {'roi': None}), (f'roi {margin}', {'roi': margin})],
+                           iou_threshold)
+
+
+def inputs_benchmark(data_path, img_size, normalization, num_frames=20, max_videos=50, face_margin=0.3):
+    """
+    Compare cropping faces to the same size and preparing them for the classifier
+    to fused cropping, resizing and normalizing by time per video and input difference.
+    """
+    net, cfg = df_retinaface.load_face_detector()
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    times = {'separate': 0.0, 'fused': 0.0}
+    differences = []
+    for video in videos:
+        faces = df_retinaface.detect_faces(net, video, cfg, num_frames)
+        start = time.time()
+        inputs = test.prepare_frames(test.crop_faces(faces, video, face_margin, num_frames),
+                                     img_size, normalization).clone()
+        times['separate'] += time.time() - start
+        start = time.time()
+        fused = test.face_inputs(faces, video, face_margin, img_size, normalization).cpu()
+        times['fused'] += time.time() - start
+        if len(inputs) > 0:
+            differences.append((inputs - fused).abs().mean().item())
+    for name, total in times.items():
+        print(f"{name}: {total / max(1, len(videos)) * 1000:.1f} ms per video")
+    print(f"Speedup {times['separate'] / max(times['fused'], 1e-9):.2f}x, mean absolute input difference "
+          f"{np.mean(differences) if differences else float('nan'):.5f} over {len(differences)} videos with faces")
+
+
+def compare_face_detectors(frames, variants, iou_threshold=0.5):
+    """
+    Detect faces in the frames of videos with face detector variants and compare each
+    to the first one by box IoU, recall of its faces and latency per frame.
+    # Arguments:
+        variants: (name, options) pairs, the options are configured to load the variant.
+    """
+    initial = {key: df_retinaface.options[key]
+               for _, variant in variants for key in variant}
+    dets, latencies = {}, {}
+    try:
+        for name, variant in variants:
+            df_retinaface.configure(**variant)
+            net, cfg = df_retinaface.load_face_detector()
+            start = time.time()
+            dets[name] = [face[1] for video_frames in frames
+                          for face in df_retinaface.detect_frames(video_frames, net, cfg)]
+            latencies[name] = (time.time() - start) / max(1, len(dets[name]))
+    finally:
+        df_retinaface.configure(**initial)
+    reference_name = variants[0][0]
+    print(f"{len(dets[reference_name])} frames of {len(frames)} videos, "
+          f"{sum(len(faces) > 0 for faces in dets[reference_name])} with a face in {reference_name}:")
+    for name, _ in variants[1:]:
+        ious, found, missed, extra = [], 0, 0, 0
+        for reference, faces in zip(dets[reference_name], dets[name]):
+            if len(reference) == 0:
+                extra += len(faces) > 0
+                continue
+            iou = matrix_iou(reference[:1, :4], faces[:1, :4])[0, 0] if len(faces) else 0.0
+            ious.append(iou)
+            if iou >= iou_threshold:
+                found += 1
+            else:
+                missed += 1
+        print(f"{name}: mean box IoU {np.mean(ious) if ious else float('nan'):.4f}, "
+              f"recall at IoU {iou_threshold} {found / max(1, found + missed):.4f}, "
+              f"{extra} faces not found by {reference_name}")
+        print(f"{name}: {latencies[name] * 1000:.1f} ms per frame, {latencies[reference_name] * 1000:.1f} ms "
+              f"{reference_name}, speedup {latencies[reference_name] / latencies[name]:.2f}x")
+
+
+def legacy_prior_boxes(cfg, image_size):
+    """Anchor generation with python loops as PriorBox.forward did before it was vectorized."""
+    feature_maps = [[ceil(image_size[0]/step), ceil(image_size[1]/step)]
+                    for step in cfg['steps']]
+    anchors = []
+    for k, f in enumerate(feature_maps):
+        min_sizes = cfg['min_sizes'][k]
+        for i, j in product(range(f[0]), range(f[1])):
+            for min_size in min_sizes:
+                s_kx = min_size / image_size[1]
+                s_ky = min_size / image_size[0]
+                dense_cx = [x * cfg['steps'][k] / image_size[1]
+                            for x in [j + 0.5]]
+                dense_cy = [y * cfg['steps'][k] / image_size[0]
+                            for y in [i + 0.5]]
+                for cy, cx in product(dense_cy, dense_cx):
+                    anchors += [cx, cy, s_kx, s_ky]
+    output = torch.Tensor(anchors).view(-1, 4)
+    if cfg['clip']:
+        output.clamp_(max=1, min=0)
+    return output
+
+
+def priorbox_benchmark(repeats=10):
+    """Compare loop, vectorized and cached anchor generation at 720p and 1080p."""
+    for name, image_size in [('720p', (720, 1280)), ('1080p', (1080, 1920))]:
+        timings = {}
+        generators = {'loop': lambda: legacy_prior_boxes(cfg_re50, image_size),
+                      'vectorized': lambda: PriorBox(cfg_re50, image_size=image_size).forward(),
+                      'cached': lambda: cached_priors(cfg_re50, image_size)}
+        # the cached anchors are generated before timing
+        cached_priors(cfg_re50, image_size)
+        for method, generate in generators.items():
+            start = time.time()
+            for _ in range(repeats):
+                priors = generate()
+            timings[method] = (time.time() - start) / repeats
+        equal = torch.equal(legacy_prior_boxes(cfg_re50, image_size), priors)
+        print(f"{name} ({priors.shape[0]} anchors), same anchors: {equal}")
+        for method, duration in timings.items():
+            print(f"{method}: {duration * 1000:.2f} ms, speedup {timings['loop'] / duration:.1f}x")
+        print()
+
+
+def legacy_py_cpu_nms(dets, thresh):
+    """NMS that removes the overlaps of one box per iteration as py_cpu_nms did before it was vectorized."""
+    x1, y1, x2, y2, scores = dets[:, 0], dets[:, 1], dets[:, 2], dets[:, 3], dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+        order = order[np.where(ovr <= thresh)[0] + 1]
+    return keep
+
+
+def legacy_nms(boxes, scores, overlap=0.5, top_k=200):
+    """NMS with index_select in a loop as box_utils.nms did before it was vectorized."""
+    keep = torch.zeros(scores.size(0), dtype=torch.long)
+    x1, y1, x2, y2 = boxes.unbind(1)
+    area = torch.mul(x2 - x1, y2 - y1)
+    idx = scores.sort(0)[1][-top_k:]
+    count = 0
+    while idx.numel() > 0:
+        i = idx[-1]
+        keep[count] = i
+        count += 1
+        if idx.size(0) == 1:
+            break
+        idx = idx[:-1]
+        xx1 = torch.clamp(torch.index_select(x1, 0, idx), min=x1[i])
+        yy1 = torch.clamp(torch.index_select(y1, 0, idx), min=y1[i])
+        xx2 = torch.clamp(torch.index_select(x2, 0, idx), max=x2[i])
+        yy2 = torch.clamp(torch.index_select(y2, 0, idx), max=y2[i])
+        inter = torch.clamp(xx2 - xx1, min=0.0) * torch.clamp(yy2 - yy1, min=0.0)
+        union = (torch.index_select(area, 0, idx) - inter) + area[i]
+        idx = idx[(inter/union).le(overlap)]
+    return keep, count
+
+
+def candidate_boxes(num_boxes, num_faces=30, seed=0):
+    """
+    Boxes and scores as the face detector outputs them at a low confidence threshold:
+    many overlapping boxes around a few faces and scattered boxes elsewhere.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(100, 1800, (num_faces, 2))
+    sizes = rng.uniform(20, 300, num_faces)
+    face = rng.integers(0, num_faces, num_boxes)
+    cx = centers[face, 0] + rng.normal(0, 0.1, num_boxes) * sizes[face]
+    cy = centers[face, 1] + rng.normal(0, 0.1, num_boxes) * sizes[face]
+    size = sizes[face] * rng.uniform(0.7, 1.3, num_boxes)
+    scores = rng.uniform(0.02, 1, num_boxes)
+    return np.stack([cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2, scores], axis=1).astype(np.float32)
+
+
+def nms_benchmark(sizes=(1000, 5000), faces=(30, 300), threshold=0.4, repeats=5):
+    """
+    Check that vectorized and loop NMS keep the same boxes and compare their speed
+    for as many candidates as the WIDER FACE evaluation keeps at confidence threshold 0.02.
+    """
+    for num_boxes, num_faces in product(sizes, faces):
+        dets = candidate_boxes(num_boxes, num_faces)
+        boxes, scores = torch.from_numpy(dets[:, :4]), torch.from_numpy(dets[:, 4])
+        runs = {'py_cpu_nms': (legacy_py_cpu_nms, py_cpu_nms, lambda run: run(dets, threshold)),
+                'box_utils.nms': (legacy_nms, nms, lambda run: run(boxes, scores, threshold, top_k=num_boxes))}
+        print(f"{num_boxes} boxes around {num_faces} faces:")
+        for name, (loop, vectorized, call) in runs.items():
+            timings = {}
+            for method, run in [('loop', loop), ('vectorized', vectorized)]:
+                start = time.time()
+                for _ in range(repeats):
+                    call(run)
+                timings[method] = (time.time() - start) / repeats
+            keep, legacy_keep = call(vectorized), call(loop)
+            if name == 'box_utils.nms':
+                equal = keep[1] == legacy_keep[1] and torch.equal(keep[0], legacy_keep[0])
+            else:
+                equal = list(keep) == list(legacy_keep)
+            print(f"{name}, same boxes: {equal}, loop: {timings['loop'] * 1000:.2f} ms, "
+                  f"vectorized: {timings['vectorized'] * 1000:.2f} ms, speedup {timings['loop'] / timings['vectorized']:.1f}x")
+        # boxes of four images in one call give the same boxes as each image on its own
+        image_ids = torch.arange(num_boxes) % 4
+        kept = batched_nms(boxes, scores, image_ids, threshold)
+        equal = True
+        for image in range(4):
+            indices = torch.nonzero(image_ids == image)[:, 0]
+            keep, count = nms(boxes[indices], scores[indices], threshold, top_k=num_boxes)
+            equal &= torch.equal(kept[image_ids[kept] == image], indices[keep[:count]])
+        print(f"batched_nms of 4 images, same boxes as per image: {equal}")
+        print()
+
+
+def _memory_run(videos, num_frames, pool, retain_crops=None):
+    """Detect and crop faces of the videos and measure the memory of this process."""
+    if pool:
+        df_retinaface.configure(buffer_pool=BufferPool())
+    df_retinaface.configure(retain_crops=retain_crops)
+    net, cfg = df_retinaface.load_face_detector()
+    peaks = []
+    held = []
+    for video in videos:
+        # tracing restarts for every video, so the peak is per video
+        tracemalloc.start()
+        faces = df_retinaface.detect_faces(net, video, cfg, num_frames)
+        # memory that the detected faces keep until they are cropped
+        held.append(tracemalloc.get_traced_memory()[0])
+        df_retinaface.extract_frames(
+            faces, video, save_to=None, face_margin=0.3, num_frames=num_frames, test=True)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del faces
+    pool = df_retinaface.options['buffer_pool']
+    # linux reports the maximum resident set size in KB
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return np.mean(peaks), np.mean(held), max_rss, None if pool is None else (pool.requests, pool.allocations)
+
+
+def memory_benchmark(data_path, num_frames=20, max_videos=50):
+    """
+    Compare peak memory per video and buffer allocations with and without the buffer pool,
+    and the memory that detected faces keep with full frames and with retained face crops.
+    Each variant runs in a fresh process, so that the peak RSS is not shared.
+    """
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    ctx = multiprocessing.get_context('spawn')
+    variants = [('No buffer pool', False, None), ('Buffer pool', True, None),
+                ('Retained face crops', False, 0.3)]
+    for name, pool, retain_crops in variants:
+        with ctx.Pool(1) as workers:
+            peak, held, max_rss, allocations = workers.apply(
+                _memory_run, (videos, num_frames, pool, retain_crops))
+        print(f"{name} ({len(videos)} videos, {num_frames} frames per video):")
+        print(f"Peak traced memory: {peak / 1024**2:.1f} MB per video")
+        print(f"Kept by the detected faces: {held / 1024**2:.1f} MB per video")
+        print(f"Peak RSS: {max_rss:.1f} MB")
+        if allocations is not None:
+            requests, allocated = allocations
+            print(f"Buffer allocations: {allocated} instead of {requests} "
+                  f"({requests / len(videos):.1f} per video without pool)")
+        print()
+
+
+def store_benchmark(data_path, num_frames=20, max_videos=50, runs=3):
+    """
+    Detect the faces of the videos in several runs with a detection store that is written
+    to disk and loaded again after each run, and report the face detection time per run and
+    the videos that were found in the store. Every run after the first should find all videos,
+    including videos that decode fewer frames than sampled.
+    """
+    net, cfg = df_retinaface.load_face_detector()
+    videos = [video for vids in collect_videos(
+        data_path, max_videos).values() for video in vids]
+    sampled = [df_retinaface.read_frames(video, num_frames, return_indices=True) for video in videos]
+    short = sum(len(frames) < len(indices) for frames, indices in sampled)
+    print(f"{len(videos)} videos, {short} decode fewer than {num_frames} frames.")
+    with tempfile.TemporaryDirectory() as store_dir:
+        for run in range(runs):
+            store = DetectionStore(store_dir)
+            with df_retinaface.configured(detection_store=store):
+                config = df_retinaface.detection_config()
+                stored = [store.get(config, video, indices, len(frames)) is not None
+                          for video, (frames, indices) in zip(videos, sampled)]
+                start = time.time()
+                for video, (frames, indices) in zip(videos, sampled):
+                    df_retinaface.detect_video_frames(net, video, cfg, frames, indices)
+                duration = time.time() - start
+            store.flush()
+            stored_short = sum(found for found, (frames, indices) in zip(stored, sampled)
+                               if len(frames) < len(indices))
+            print(f"Run {run + 1}: {duration:.2f} s, {sum(stored)} of {len(videos)} videos "
+                  f"from the store ({stored_short} of {short} short videos)")
+
+
+def main():
+    args = parser.parse_args()
+    if args.task == 'decode':
+        decode_benchmark(args.data_path, num_frames=args.num_frames,
+                         max_videos=args.max_videos)
+    elif args.task == 'det_scale':
+        scales = [parse_det_scale(scale)
+                  for scale in args.det_scales.split(',')]
+        detection_scale_benchmark(args.data_path, scales, num_frames=args.num_frames,
+                                  max_videos=args.max_videos)
+    elif args.task == 'detect_batch':
+        batch_sizes = [int(batch_size)
+                       for batch_size in args.batch_sizes.split(',')]
+        detect_batch_benchmark(args.data_path, batch_sizes, num_frames=args.num_frames,
+                               max_videos=args.max_videos)
+    elif args.task == 'detector':
+        datasets = list(zip(args.dataset.split(','), args.data_path.split(','),
+                            args.detection_method.split(',')))
+        detector_benchmark(datasets, ['resnet50', 'mobile0.25'], num_frames=args.num_frames,
+                           max_videos=args.max_videos)
+    elif args.task == 'priorbox':
+        priorbox_benchmark()
+    elif args.task == 'precision':
+        precision_benchmark(args.dataset, args.data_path,
+                            args.detection_method.split(','), args.precision)
+    elif args.task == 'torchscript':
+        torchscript_benchmark(['resnet50', 'mobile0.25'])
+    elif args.task == 'quantize':
+        quantize_benchmark(args.data_path, num_frames=args.num_frames,
+                           max_videos=args.max_videos)
+    elif args.task == 'deploy':
+        deploy_benchmark(args.data_path, [int(level) for level in args.det_levels.split(',')],
+                         num_frames=args.num_frames, max_videos=args.max_videos)
+    elif args.task == 'roi':
+        roi_benchmark(args.data_path, args.roi, num_frames=args.num_frames,
+                      max_videos=args.max_videos)
+    elif args.task == 'inputs':
+        inputs_benchmark(args.data_path, args.img_size, args.normalization,
+                         num_frames=args.num_frames, max_videos=args.max_videos)
+    elif args.task == 'nms':
+        nms_benchmark()
+    elif args.task == 'memory':
+        memory_benchmark(args.data_path, num_frames=args.num_frames,
+                         max_videos=args.max_videos)
+    elif args.task == 'store':
+        store_benchmark(args.data_path, num_frames=args.num_frames,
+                        max_videos=args.max_videos)
+    elif args.task == 'early_exit':
+        thresholds = [None if threshold == 'none' else float(threshold)
+                      for threshold in args.thresholds.split(',')]
+        early_exit_benchmark(args.dataset, args.data_path, args.detection_method,
+                             thresholds, min_frames=args.min_frames)
+    else:
+        raise ValueError(f"{args.task} is not an available measurement.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,15 @@
 # author: Christopher Otto
-import os
 import cv2
 import numpy as np
 import pandas as pd
 import metrics
 import torch
 import time
+import torch.multiprocessing as mp
 import torch.nn as nn
 import torchvision
 import torchvision.models as models
-import torchvision.transforms as transforms
 
-from albumentations import Resize
 from tqdm import tqdm
 from sklearn.metrics import confusion_matrix
 from sklearn.metrics import average_precision_score, roc_auc_score
@@ -19,95 +17,321 @@ from sklearn.model_selection import ShuffleSplit
 from sklearn.metrics import roc_curve
 from sklearn.metrics import roc_auc_score
 from facedetector.retinaface import df_retinaface
+from pipeline import Pipeline, Stage
 
-def vid_inference(model, video_frames, label, img_size, normalization, sequence_model=False, single=False):
+# mean and standard deviation per channel of the input normalizations
+NORMALIZATION = {'xception': ([0.5, 0.5, 0.5], [0.5, 0.5, 0.5]),
+                 'imagenet': ([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])}
+
+
+def prepare_frames(video_frames, img_size, normalization):
+    """
+    Turn face crops into the normalized model input of shape (frames, 3, img_size, img_size).
+    Frames are written into one input buffer that is reused if a buffer pool is configured.
+    """
+    mean, std = NORMALIZATION[normalization]
+    mean = torch.tensor(mean).view(3, 1, 1)
+    std = torch.tensor(std).view(3, 1, 1)
+    inputs = torch.from_numpy(df_retinaface.buffer(
+        'inputs', (len(video_frames), 3, img_size, img_size), np.float32))
+    for idx, frame in enumerate(video_frames):
+        # turn image to rgb color
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB,
+                           dst=df_retinaface.buffer('rgb', frame.shape))
+        # resize to DNN input size
+        resized = cv2.resize(rgb, (img_size, img_size), df_retinaface.buffer(
+            'resized', (img_size, img_size, 3)), interpolation=cv2.INTER_LINEAR)
+        # channels first, turn dtype from uint8 to float and normalize to [0,1] range
+        inputs[idx].copy_(torch.from_numpy(resized).permute(2, 0, 1))
+        inputs[idx].div_(255.0)
+        # normalize by imagenet stats
+        inputs[idx].sub_(mean).div_(std)
+    return inputs
+
+
+def face_inputs(faces, video, face_margin, img_size, normalization):
+    """
+    Crop the detected faces of a video, resize them to img_size and normalize them in one pass.
+    Returns the model input of shape (faces, 3, img_size, img_size) on the device, like
+    prepare_frames(crop_faces(...)) without resizing the crops to the same size first.
+    """
+    crops = [crop for crop in df_retinaface.face_crops(faces, video, face_margin)
+             if crop.size > 0]
+    resized = df_retinaface.buffer('face_inputs', (len(crops), img_size, img_size, 3))
+    for idx, crop in enumerate(crops):
+        # bilinear interpolation from the frame to the DNN input size, then rgb color in place
+        cv2.resize(crop, (img_size, img_size), resized[idx], interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(resized[idx], cv2.COLOR_BGR2RGB, dst=resized[idx])
+    device = df_retinaface.get_device()
+    mean, std = NORMALIZATION[normalization]
+    # (x / 255 - mean) / std as one multiply-add per channel
+    scale = torch.tensor([1 / (255 * s) for s in std], device=device).view(1, 3, 1, 1)
+    offset = torch.tensor([-m / s for m, s in zip(mean, std)], device=device).view(1, 3, 1, 1)
+    # uint8 crops are moved to the device and turned channels first by the multiply-add
+    crops = torch.from_numpy(resized).to(device).permute(0, 3, 1, 2)
+    out = None
+    if device.type == 'cpu':
+        out = torch.from_numpy(df_retinaface.buffer(
+            'inputs', (len(resized), 3, img_size, img_size), np.float32))
+    return torch.addcmul(offset, crops, scale, out=out)
+
+
+def vid_inference(model, video_frames, label, img_size, normalization, sequence_model=False, single=False, duplicates=None):
+    """
+    # Arguments:
+        video_frames: Face crops or the model input of face_inputs.
+    """
     # model evaluation mode
-    model.cuda()
+    device = df_retinaface.get_device()
+    model.to(device)
     model.eval()
-    device = "cuda" if torch.cuda.is_available() else "cpu"
     loss_func = nn.BCEWithLogitsLoss()
     #label = torch.from_numpy(label).to(device)
-    # get prediction for each frame from vid
-    avg_vid_loss = []
-    avg_preds = []
-    avg_loss = []
-    frame_level_preds = []
-    if sequence_model:
-        all_vid_frames = []
-        for frame in video_frames:
-            # turn image to rgb color
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # resize to DNN input size
-            resize = Resize(width=img_size, height=img_size)
-            frame = resize(image=frame)['image']
-            frame = torch.tensor(frame).to(device)
-            # forward pass of inputs and turn on gradient computation during train
-            with torch.no_grad():
-                # predict for frame
-                # channels first
-                frame = frame.permute(2, 0, 1)
-                # turn dtype from uint8 to float and normalize to [0,1] range
-                frame = frame.float() / 255.0
-                # normalize by imagenet stats
-                if normalization == 'xception':
-                    transform = transforms.Normalize(
-                        [0.5, 0.5, 0.5], [0.5, 0.5, 0.5])
-                elif normalization == "imagenet":
-                    transform = transforms.Normalize(
-                        [0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-                frame = transform(frame)
-            all_vid_frames.append(frame.unsqueeze(0).cpu().numpy())
-        all_vid_frames = torch.from_numpy(
-            np.array(all_vid_frames).transpose(1, 0, 2, 3, 4)).float().to(device)
-        prediction = model(all_vid_frames)
-
-        # get probabilitiy for frame from logits
-        preds = torch.sigmoid(prediction)
-
-        # calculate loss from logits
-        loss = loss_func(prediction.squeeze(1), torch.tensor(
-            label).unsqueeze(0).type_as(prediction))
-
-        # return the prediction for the video as average of the predictions over all frames
-        return np.mean(preds.cpu().numpy()), np.mean(loss.cpu().numpy()), frame_level_preds
+    # all frames are moved to the device at once
+    if torch.is_tensor(video_frames):
+        inputs = video_frames.to(device)
     else:
-        for frame in video_frames:
-            # turn image to rgb color
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            # resize to DNN input size
-            resize = Resize(width=img_size, height=img_size)
-            frame = resize(image=frame)['image']
-            frame = torch.tensor(frame).to(device)
-            # forward pass of inputs and turn on gradient computation during train
-            with torch.no_grad():
-                # predict for frame
-                # channels first
-                frame = frame.permute(2, 0, 1)
-                # turn dtype from uint8 to float and normalize to [0,1] range
-                frame = frame.float() / 255.0
-                # normalize by imagenet stats
-                if normalization == 'xception':
-                    transform = transforms.Normalize(
-                        [0.5, 0.5, 0.5], [0.5, 0.5, 0.5])
-                elif normalization == "imagenet":
-                    transform = transforms.Normalize(
-                        [0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-                frame = transform(frame)
-                # add batch dimension and input into model to get logits
-                predictions = model(frame.unsqueeze(0))
-                # get probabilitiy for frame from logits
-                preds = torch.sigmoid(predictions)
-                avg_preds.append(preds.cpu().numpy())
-                frame_level_preds.extend(preds.cpu().numpy()[-1])
-                # calculate loss from logits
-                loss = loss_func(predictions.squeeze(1), torch.tensor(
-                    label).unsqueeze(0).type_as(predictions))
-                avg_loss.append(loss.cpu().numpy())
-        # return the prediction for the video as average of the predictions over all frames
-        return np.mean(avg_preds), np.mean(avg_loss), frame_level_preds
-
-
-def inference(model, test_df, img_size, normalization, dataset, method,face_margin, sequence_model=False, ensemble=False, num_frames=None, single=False, cmd=False):
+        inputs = prepare_frames(video_frames, img_size, normalization).to(device)
+    # forward pass of inputs and turn on gradient computation during train
+    with torch.no_grad():
+        if sequence_model:
+            # add batch dimension, the frames are the sequence
+            with df_retinaface.autocast(device):
+                prediction = model(inputs.unsqueeze(0)).float()
+
+            # get probabilitiy for frame from logits
+            preds = torch.sigmoid(prediction)
+
+            # calculate loss from logits
+            loss = loss_func(prediction.squeeze(1), torch.tensor(
+                label).unsqueeze(0).type_as(prediction))
+
+            # return the prediction for the video as average of the predictions over all frames
+            return np.mean(preds.cpu().numpy()), np.mean(loss.cpu().numpy()), []
+        # get prediction for each frame from vid
+        preds = torch.empty(len(video_frames), device=device)
+        losses = torch.empty(len(video_frames), device=device)
+        for idx in range(len(video_frames)):
+            if duplicates is not None and duplicates[idx] is not None:
+                # reuse the prediction of the duplicated frame
+                preds[idx] = preds[duplicates[idx]]
+                losses[idx] = losses[duplicates[idx]]
+                continue
+            # predict for frame, input with batch dimension to get logits
+            with df_retinaface.autocast(device):
+                predictions = model(inputs[idx:idx + 1]).float()
+            # get probabilitiy for frame from logits
+            preds[idx] = torch.sigmoid(predictions)[0, 0]
+            # calculate loss from logits
+            losses[idx] = loss_func(predictions.squeeze(1), torch.tensor(
+                label).unsqueeze(0).type_as(predictions))
+        frame_level_preds = preds.cpu().numpy()
+    # return the prediction for the video as average of the predictions over all frames
+    return np.mean(frame_level_preds), np.mean(losses.cpu().numpy()), list(frame_level_preds)
+
+
+def crop_faces(faces, video, face_margin, num_frames, single=False, cmd=False, img_size=None, normalization=None):
+    """
+    Crop the detected faces of a video to images of the same size.
+    With the fused_inputs option, the faces are turned into the model input with face_inputs instead.
+    """
+    if df_retinaface.options['fused_inputs'] and not single and img_size is not None:
+        return face_inputs(faces, video, face_margin, img_size, normalization)
+    vid_frames = df_retinaface.extract_frames(
+        faces, video, save_to=None, face_margin=face_margin, num_frames=num_frames, test=True)
+    if single:
+        name = video[:-4] + ".jpg"
+        # save image if accessed via web application
+        if not cmd:
+            print("Save image.")
+            cv2.imwrite(name, vid_frames[0])
+    return vid_frames
+
+
+def classify_video(model, vid_frames, label, img_size, normalization, sequence_model=False, info=None):
+    """
+    Prediction, loss, frame-level predictions and information about the video or None if no face was detected.
+    # Arguments:
+        info: Information about the video that is extended, e.g. df_retinaface.detection_info(faces).
+    """
+    # if no face detected continue to next video
+    if len(vid_frames) == 0:
+        print("No face detected.")
+        return None
+    info = dict(info or {})
+    # inference for each frame
+    if not sequence_model:
+        duplicates = None
+        if df_retinaface.options['dedup'] is not None and df_retinaface.options['reuse_predictions']:
+            # duplicate face crops get the prediction of the crop they duplicate
+            duplicates = df_retinaface.find_duplicates(vid_frames)
+            info['Reused'] = sum(1 for dup in duplicates if dup is not None)
+        # frame level auc can be measured
+        vid_pred, vid_loss, frame_level_preds = vid_inference(
+            model, vid_frames, label, img_size, normalization, sequence_model, duplicates=duplicates)
+        return vid_pred, vid_loss, frame_level_preds, info
+    # only video level
+    vid_pred, vid_loss, _ = vid_inference(
+        model, vid_frames, label, img_size, normalization, sequence_model, single=True)
+    return vid_pred, vid_loss, [], info
+
+
+def early_exit_inference(net, cfg, model, video, label, img_size, normalization, face_margin, num_frames, threshold, min_frames=3):
+    """
+    Classify the sampled frames of a video in coarse-to-fine order and stop once the prediction is confident.
+    Frames are only decoded and searched for faces until the video is decided.
+    # Arguments:
+        threshold: Stop when all frame predictions agree and their mean is
+                   at least threshold or at most 1 - threshold.
+        min_frames: Number of frames with a face that are classified at least.
+    Returns prediction, loss, frame-level predictions and {'Frames': number of frames used} or None if no face was detected.
+    """
+    preds = []
+    losses = []
+    frames_used = 0
+    frames = df_retinaface.iter_frames(
+        video, num_frames, df_retinaface.coarse_to_fine(num_frames))
+    for _, frame in frames:
+        frames_used += 1
+        faces = df_retinaface.detect_frames([frame], net, cfg)
+        vid_frames = crop_faces(faces, video, face_margin, 1, img_size=img_size, normalization=normalization)
+        if len(vid_frames) == 0:
+            continue
+        pred, loss, _ = vid_inference(
+            model, vid_frames, label, img_size, normalization)
+        preds.append(pred)
+        losses.append(loss)
+        if len(preds) >= min_frames:
+            agree = np.all(np.round(preds) == np.round(preds[0]))
+            mean_pred = np.mean(preds)
+            if agree and (mean_pred >= threshold or mean_pred <= 1 - threshold):
+                break
+    # stop decoding the remaining frames
+    frames.close()
+    if not preds:
+        print("No face detected.")
+        return None
+    return np.mean(preds), np.mean(losses), preds, {'Frames': frames_used}
+
+
+def inference_pipeline(net, cfg, model, test_df, img_size, normalization, face_margin, num_frames, sequence_model, stage_workers, single=False, cmd=False, queue_size=4):
+    """
+    Run the videos through decode, detection, crop and classification stages in parallel.
+    # Arguments:
+        stage_workers: Number of worker threads per stage, e.g. {'decode': 2, 'detect': 1}.
+                       Stages that are not given get one worker.
+        queue_size: Number of videos that can wait in front of each stage.
+    """
+    workers = {'decode': 1, 'detect': 1, 'crop': 1, 'classify': 1}
+    for name, count in stage_workers.items():
+        if name not in workers:
+            raise ValueError(f"{name} is not a pipeline stage.")
+        workers[name] = count
+
+    def decode(item):
+        video, label = item
+        return video, label, df_retinaface.read_frames(video, num_frames, return_indices=True)
+
+    def detect(item):
+        video, label, (frames, indices) = item
+        return video, label, df_retinaface.detect_video_frames(net, video, cfg, frames, indices)
+
+    def crop(item):
+        video, label, faces = item
+        return label, crop_faces(faces, video, face_margin, num_frames, single=single, cmd=cmd, img_size=img_size, normalization=normalization), df_retinaface.detection_info(faces)
+
+    def classify(item):
+        label, vid_frames, info = item
+        return classify_video(model, vid_frames, label, img_size, normalization, sequence_model, info)
+
+    stages = [Stage('decode', decode, workers['decode']),
+              Stage('detect', detect, workers['detect']),
+              Stage('crop', crop, workers['crop']),
+              Stage('classify', classify, workers['classify'])]
+    engine = Pipeline(stages, queue_size=queue_size)
+    rows = list(test_df.iterrows())
+    order = schedule(test_df)
+    items = [(rows[pos][1].loc['video'], rows[pos][1].loc['label'])
+             for pos in order]
+    results = [None] * len(rows)
+    for pos, result in zip(order, engine.run(items)):
+        results[pos] = result
+    engine.report()
+    return results
+
+
+def schedule(test_df):
+    """
+    Positions of the videos in the order they are processed.
+    If a video index is configured, the most expensive videos come first,
+    so that no worker is left with a long video at the end.
+    """
+    index = df_retinaface.options['video_index']
+    if index is None:
+        return list(range(test_df.shape[0]))
+    return index.schedule(list(test_df['video']))
+
+
+# face detector, classifier and settings of a worker process
+_worker = {}
+
+
+def _init_worker(model, detection_options, seed, num_threads):
+    """Load the face detector and classifier of a worker process."""
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    torch.backends.cudnn.deterministic = True
+    # share the cpu cores between the workers
+    torch.set_num_threads(num_threads)
+    df_retinaface.configure(**detection_options)
+    _worker['net'], _worker['cfg'] = df_retinaface.load_face_detector()
+    _worker['model'] = model
+
+
+def _infer_video(task):
+    """
+    Prediction for one video in a worker process.
+    New entries of the detection store are sent back to the main process, which writes the store.
+    """
+    pos, video, label, img_size, normalization, face_margin, num_frames, sequence_model, early_exit, min_frames = task
+    if early_exit is not None:
+        return pos, early_exit_inference(_worker['net'], _worker['cfg'], _worker['model'], video, label, img_size, normalization, face_margin, num_frames, early_exit, min_frames), None
+    faces = df_retinaface.detect_faces(
+        _worker['net'], video, _worker['cfg'], num_frames=num_frames)
+    vid_frames = crop_faces(faces, video, face_margin, num_frames, img_size=img_size, normalization=normalization)
+    store = df_retinaface.options['detection_store']
+    return pos, classify_video(_worker['model'], vid_frames, label, img_size, normalization, sequence_model, df_retinaface.detection_info(faces)), None if store is None else store.take_new()
+
+
+def sharded_inference(model, test_df, img_size, normalization, face_margin, num_frames, sequence_model, workers, seed=24, early_exit=None, min_frames=3):
+    """
+    Split the videos into one shard per worker process.
+    If a video index is configured, workers instead take one video at a time, the most expensive first.
+    Each worker holds its own face detector and classifier.
+    Returns the results in the order of test_df, so that metrics are the same as for the serial run.
+    """
+    rows = list(test_df.iterrows())
+    tasks = [(pos, rows[pos][1].loc['video'], rows[pos][1].loc['label'], img_size, normalization, face_margin, num_frames, sequence_model, early_exit, min_frames)
+             for pos in schedule(test_df)]
+    if df_retinaface.options['video_index'] is None:
+        # contiguous shards of equal size
+        chunksize = max(1, int(np.ceil(len(tasks) / workers)))
+    else:
+        # idle workers take the next most expensive video
+        chunksize = 1
+    # share the pytorch cpu threads between the workers
+    num_threads = max(1, torch.get_num_threads() // workers)
+    results = [None] * len(tasks)
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(model, dict(df_retinaface.options), seed, num_threads)) as pool:
+        for pos, result, detections in tqdm(pool.imap_unordered(_infer_video, tasks, chunksize=chunksize), total=len(tasks)):
+            results[pos] = result
+            if detections:
+                df_retinaface.options['detection_store'].add(detections)
+    return results
+
+
+def inference(model, test_df, img_size, normalization, dataset, method,face_margin, sequence_model=False, ensemble=False, num_frames=None, single=False, cmd=False, stage_workers=None, workers=1, seed=24, early_exit=None, min_frames=3):
     running_loss = 0.0
     running_corrects = 0.0
     running_false = 0.0
@@ -118,49 +342,80 @@ def inference(model, test_df, img_size, normalization, dataset, method,face_marg
     ids = []
     frame_level_prds = []
     frame_level_labs = []
+    video_info = []
     running_corrects_frame_level = 0.0
     running_false_frame_level = 0.0
-    # load retinaface face detector
-    net, cfg = df_retinaface.load_face_detector()
     inference_time = time.time()
     print(f"Inference using {num_frames} frames per video.")
     print(f"Use face margin of {face_margin * 100} %") 
-    for idx, row in tqdm(test_df.iterrows(), total=test_df.shape[0]):
-        video = row.loc['video']
-        label = row.loc['label']
-        vid = os.path.join(video)
-        # inference (no saving of images inbetween to make it faster)
-        # detect faces, add margin, crop, upsample to same size, save to images
-        faces = df_retinaface.detect_faces(net, vid, cfg, num_frames=num_frames)
-        # save frames to images
-        # try:
-        vid_frames = df_retinaface.extract_frames(
-            faces, video, save_to=None, face_margin=face_margin, num_frames=num_frames, test=True)
-        if single:
-            name = video[:-4] + ".jpg"
-            # save image if accessed via web application
-            if not cmd:
-                print("Save image.")
-                cv2.imwrite(name, vid_frames[0])
+    if stage_workers is not None and df_retinaface.options['buffer_pool'] is not None:
+        raise ValueError("The buffer pool reuses memory for every video and can not be combined with stage workers.")
+    if df_retinaface.options['fused_inputs'] and df_retinaface.options['reuse_predictions']:
+        raise ValueError("Reusing predictions compares face crops and can not be combined with fused inputs.")
+    if df_retinaface.options['detect_videos'] > 1:
+        if df_retinaface.options['buffer_pool'] is not None:
+            raise ValueError("The buffer pool reuses memory for every video and can not be combined with detecting several videos at once.")
+        if early_exit is not None or stage_workers is not None or workers > 1:
+            print("Detecting faces of several videos at once is only available for serial inference without early exit.")
+    if early_exit is not None:
+        if sequence_model:
+            raise ValueError("Early exit is only available for frame-level models.")
+        if stage_workers is not None:
+            raise ValueError("Early exit reads videos frame by frame and can not be combined with stage workers.")
+        print(f"Stop classifying a video at a mean prediction of {early_exit} after at least {min_frames} frames.")
+    if workers > 1:
+        # every worker process loads its own face detector
+        results = sharded_inference(
+            model, test_df, img_size, normalization, face_margin, num_frames, sequence_model, workers, seed, early_exit=early_exit, min_frames=min_frames)
+    elif stage_workers is not None:
+        # load retinaface face detector
+        net, cfg = df_retinaface.load_face_detector()
+        # decode, detect, crop and classify videos in parallel stages
+        results = inference_pipeline(
+            net, cfg, model, test_df, img_size, normalization, face_margin, num_frames, sequence_model, stage_workers, single=single, cmd=cmd)
+    else:
+        # load retinaface face detector
+        net, cfg = df_retinaface.load_face_detector()
+        results = []
+        if early_exit is not None:
+            for idx, row in tqdm(test_df.iterrows(), total=test_df.shape[0]):
+                results.append(early_exit_inference(
+                    net, cfg, model, row.loc['video'], row.loc['label'], img_size, normalization, face_margin, num_frames, early_exit, min_frames))
+        else:
+            group = df_retinaface.options['detect_videos']
+            for start in tqdm(range(0, test_df.shape[0], group), total=int(np.ceil(test_df.shape[0] / group))):
+                rows = test_df.iloc[start:start + group]
+                videos = list(rows['video'])
+                # inference (no saving of images inbetween to make it faster)
+                # detect faces of a group of videos, add margin, crop, upsample to same size
+                if group == 1:
+                    videos_faces = [df_retinaface.detect_faces(net, videos[0], cfg, num_frames=num_frames)]
+                else:
+                    videos_faces = df_retinaface.detect_faces_of_videos(net, videos, cfg, num_frames)
+                for video, label, faces in zip(videos, rows['label'], videos_faces):
+                    vid_frames = crop_faces(faces, video, face_margin, num_frames, single=single, cmd=cmd,
+                                            img_size=img_size, normalization=normalization)
+                    results.append(classify_video(
+                        model, vid_frames, label, img_size, normalization, sequence_model, df_retinaface.detection_info(faces)))
+    if df_retinaface.options['detection_store'] is not None:
+        # keep the face detections for the next run
+        df_retinaface.options['detection_store'].flush()
+    for (idx, row), result in zip(test_df.iterrows(), results):
         # if no face detected continue to next video
-        if not vid_frames:
-            print("No face detected.")
+        if result is None:
             continue
-        # inference for each frame
+        video = row.loc['video']
+        label = row.loc['label']
+        vid_pred, vid_loss, frame_level_preds, info = result
+        video_info.append(info)
         if not sequence_model:
             # frame level auc can be measured
-            vid_pred, vid_loss, frame_level_preds = vid_inference(
-                model, vid_frames, label, img_size, normalization, sequence_model)
             frame_level_prds.extend(frame_level_preds)
             frame_level_labs.extend([label]*len(frame_level_preds))
             running_corrects_frame_level += np.sum(
                 np.round(frame_level_preds) == np.array([label]*len(frame_level_preds)))
             running_false_frame_level += np.sum(
                 np.round(frame_level_preds) != np.array([label]*len(frame_level_preds)))
-        else:
-            # only video level
-            vid_pred, vid_loss, _ = vid_inference(
-                model, vid_frames, label, img_size, normalization, sequence_model, single = True)
         ids.append(video)
         labs.append(label)
         prds.append(vid_pred)
@@ -172,6 +427,9 @@ def inference(model, test_df, img_size, normalization, dataset, method,face_marg
     # save predictions to csv for ensembling
     df = pd.DataFrame(list(zip(ids, labs, prds)), columns=[
                       'Video', 'Label', 'Prediction'])
+    # frames used with early exit, skipped frames with duplicate skipping and tracked frames with tracking
+    for column in dict.fromkeys(key for info in video_info for key in info):
+        df[column] = [info.get(column, 0) for info in video_info]
     if single:
         prd = np.round(prds)
         return prd[0]
@@ -207,6 +465,16 @@ def inference(model, test_df, img_size, normalization, dataset, method,face_marg
                                frame_level_labs, labels=[1, 0]))
         print(f"Frame-level AUC: {frame_level_auc}")
         print(f"Frame-level ACC: {frame_level_acc}")
+    if 'Frames' in df:
+        print(f"Frames used per video: {df['Frames'].mean():.2f} of {num_frames}")
+    if 'Detected' in df:
+        print(f"Face detector runs per video: {df['Detected'].mean():.2f} of {num_frames}")
+    if 'Tracked' in df:
+        print(f"Frames with tracked face per video: {df['Tracked'].mean():.2f} of {num_frames}")
+    if 'Skipped' in df:
+        print(f"Duplicate frames without face detection per video: {df['Skipped'].mean():.2f} of {num_frames}")
+    if 'Reused' in df:
+        print(f"Reused frame predictions per video: {df['Reused'].mean():.2f}")
     print()
     print("Cost (best possible cost is 0.0):")
     print(f"{one_rec} cost for 0.1 recall.")
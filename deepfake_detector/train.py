@@ -36,8 +36,8 @@ def train(dataset, data, method, normalization, augmentations, img_size,
     # adapted by: Christopher Otto
     """
     training_time = time.time()
-    # use gpu for calculations if available
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # use gpu for calculations if available or the configured device
+    device = df_retinaface.get_device()
     print(f"Using device: {device}")
     average_auc = []
     average_loss = []
@@ -90,7 +90,7 @@ def train(dataset, data, method, normalization, augmentations, img_size,
                 model = mesonet.MesoInception4()
                 # load mesonet weights that were pretrained on the mesonet dataset from https://github.com/DariusAf/MesoNet
                 model.load_state_dict(torch.load(
-                    "./deepfake_detector/pretrained_mods/weights/mesonet_pretrain.pth"))
+                    "./deepfake_detector/pretrained_mods/weights/mesonet_pretrain.pth", map_location='cpu'))
             elif method == 'resnet_lstm':
                 model = resnetlstm.ResNetLSTM()
             elif method == 'efficientnetb1_lstm':
@@ -98,13 +98,13 @@ def train(dataset, data, method, normalization, augmentations, img_size,
 
         else:
             # continue to train model from custom checkpoint
-            model = torch.load(load_model_path)
+            model = torch.load(load_model_path, map_location='cpu')
 
         if return_best:
             best_model_state = copy.deepcopy(model.state_dict())
 
-        # put model on gpu
-        model = model.cuda()
+        # put model on the device
+        model = model.to(device)
         # binary cross-entropy loss
         loss_func = nn.BCEWithLogitsLoss()
         lr = lr